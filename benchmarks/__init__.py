@@ -0,0 +1,5 @@
+import os
+
+# config.Config lee ADMIN_ID y CHANNEL_ID al importarse; los benchmarks no usan el bot real.
+os.environ.setdefault("ADMIN_ID", "0")
+os.environ.setdefault("CHANNEL_ID", "0")
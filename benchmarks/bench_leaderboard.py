@@ -0,0 +1,103 @@
+# benchmarks/bench_leaderboard.py
+"""
+Compares ways of paging the ranking and finding a user's position on a large users table:
+OFFSET pages and COUNT(*) ranks against keyset pages on (points, id) and the in-memory leaderboard.
+
+Run from the repository root (the number of users defaults to 1M):
+    python -m benchmarks.bench_leaderboard [users]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from sqlalchemy import select, func, insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from database.models import Base, User
+from services.point_service import PointService
+from services.leaderboard_service import leaderboard
+
+PAGE_SIZE = 10
+REPEATS = 20
+
+
+async def timed(label: str, coro_factory, repeats: int = REPEATS):
+    started = time.perf_counter()
+    for _ in range(repeats):
+        await coro_factory()
+    elapsed = (time.perf_counter() - started) / repeats
+    print(f"{label:<44} {elapsed * 1000:10.3f} ms")
+
+
+async def main(users: int):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    Session = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    print(f"Populating {users} users...")
+    rng = random.Random(42)
+    async with engine.begin() as conn:
+        for start in range(1, users + 1, 50_000):
+            rows = [
+                {"id": user_id, "username": f"user{user_id}", "points": rng.randint(0, 100_000), "level": 1}
+                for user_id in range(start, min(start + 50_000, users + 1))
+            ]
+            await conn.execute(insert(User), rows)
+
+    deep_offset = int(users * 0.9)
+    target_user = users // 2
+
+    async with Session() as session:
+        service = PointService(session)
+        # Cursor of the row just before the deep page, to compare the same page both ways
+        row = (await session.execute(
+            select(User.points, User.id).order_by(User.points.desc(), User.id.desc()).offset(deep_offset - 1).limit(1)
+        )).one()
+        cursor = (row.points, row.id)
+
+        async def offset_page():
+            stmt = select(User).order_by(User.points.desc(), User.id.desc()).offset(deep_offset).limit(PAGE_SIZE)
+            (await session.execute(stmt)).scalars().all()
+            session.expunge_all()
+
+        async def count_rank():
+            user = await session.get(User, target_user)
+            stmt = select(func.count()).select_from(User).where(User.points > user.points)  # rank without tie-break
+            (await session.execute(stmt)).scalar_one()
+
+        async def keyset_page_sql():
+            await service.get_leaderboard_page(cursor, PAGE_SIZE, start_rank=deep_offset + 1)
+            session.expunge_all()
+
+        async def rank_sql():
+            await service.get_user_rank(target_user)
+            session.expunge_all()
+
+        print(f"\nDatabase ({users} users, page at rank {deep_offset + 1}):")
+        await timed("OFFSET page", offset_page)
+        await timed("keyset page (SQL)", keyset_page_sql)
+        await timed("COUNT(*) rank", count_rank)
+        await timed("rank + neighbors (SQL fallback)", rank_sql)
+
+        started = time.perf_counter()
+        await leaderboard.rebuild(session)
+        print(f"\nIn-memory leaderboard rebuilt in {time.perf_counter() - started:.2f} s")
+
+        async def keyset_page_memory():
+            await service.get_leaderboard_page(cursor, PAGE_SIZE)
+
+        async def rank_memory():
+            await service.get_user_rank(target_user)
+
+        await timed("keyset page (in-memory)", keyset_page_memory, repeats=1000)
+        await timed("rank + neighbors (in-memory)", rank_memory, repeats=1000)
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000))
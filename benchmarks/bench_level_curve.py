@@ -0,0 +1,48 @@
+# benchmarks/bench_level_curve.py
+"""
+Microbenchmark of level resolution on a formula curve with thousands of levels: the previous
+loop that walked the thresholds one level at a time, against LevelCurve's bisect.
+
+Run from the repository root:
+    python -m benchmarks.bench_level_curve
+"""
+import random
+import time
+
+from services.level_service import LevelCurve
+
+MAX_LEVEL = 5_000
+USERS = 10_000
+
+
+def legacy_level(thresholds: dict[int, int], points: int, level: int = 1) -> int:
+    """The level-up loop as it used to run, one dict lookup per level climbed."""
+    while True:
+        points_for_next_level = thresholds.get(level + 1, float('inf'))
+        if points_for_next_level == float('inf') or points < points_for_next_level:
+            return level
+        level += 1
+
+
+def main():
+    curve = LevelCurve.from_formula(10, 2, MAX_LEVEL)
+    table = {level: curve.threshold(level) for level in range(1, MAX_LEVEL + 1)}
+    rng = random.Random(7)
+    points = [rng.randint(0, curve.thresholds[-1]) for _ in range(USERS)]
+
+    started = time.perf_counter()
+    legacy_result = [legacy_level(table, p) for p in points]
+    legacy = time.perf_counter() - started
+
+    started = time.perf_counter()
+    bisect_result = curve.levels_for(points)
+    batch = time.perf_counter() - started
+    assert legacy_result == bisect_result
+
+    print(f"{USERS} users on a {MAX_LEVEL}-level curve")
+    print(f"level-by-level loop   {legacy * 1000:9.1f} ms")
+    print(f"LevelCurve.levels_for {batch * 1000:9.1f} ms  ({legacy / batch:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
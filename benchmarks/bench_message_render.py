@@ -0,0 +1,108 @@
+# benchmarks/bench_message_render.py
+"""
+Render throughput of the ranking and profile messages: the previous str.format / += code,
+against the join-based builders in utils.message_utils.
+
+Run from the repository root:
+    python -m benchmarks.bench_message_render
+"""
+import asyncio
+import datetime
+import time
+
+from database.models import Mission, User
+from services.leaderboard_service import LeaderboardEntry
+from services.level_service import get_level_threshold
+from utils.message_utils import get_profile_message, get_ranking_message
+from utils.messages import BOT_MESSAGES
+
+RANKING_SIZES = [10, 100]
+MISSIONS = 20
+ACHIEVEMENTS = 10
+REPEATS = 20_000
+
+
+def legacy_ranking(users_ranking, start_rank: int = 1, title: str = None) -> str:
+    ranking_text = (title or BOT_MESSAGES["ranking_title"]) + "\n\n"
+    if not users_ranking:
+        return ranking_text + BOT_MESSAGES["no_ranking_data"]
+    for i, user in enumerate(users_ranking):
+        display_name = user.username if user.username else user.first_name if user.first_name else "Usuario Desconocido"
+        ranking_text += BOT_MESSAGES["ranking_entry"].format(
+            rank=start_rank + i,
+            username=display_name,
+            points=user.points,
+            level=user.level
+        ) + "\n"
+    return ranking_text
+
+
+def legacy_profile(user, active_missions, achievements) -> str:
+    next_level_threshold = get_level_threshold(user.level + 1)
+    if next_level_threshold != float('inf'):
+        points_to_next_level_text = BOT_MESSAGES["profile_points_to_next_level"].format(
+            points_needed=next_level_threshold - user.points,
+            next_level=user.level + 1,
+            next_level_threshold=next_level_threshold
+        )
+    else:
+        points_to_next_level_text = BOT_MESSAGES["profile_max_level"]
+    achievements_text = BOT_MESSAGES["profile_no_achievements"]
+    if achievements:
+        achievements_list = [
+            f"{ach.get('icon', '')} {ach.get('name', ach_id)} (Desbloqueado el: {ach['granted_at'].strftime('%d/%m/%Y')})"
+            for ach_id, ach in achievements.items()
+        ]
+        achievements_text = BOT_MESSAGES["profile_achievements_title"] + "\n" + "\n".join(achievements_list)
+    missions_text = BOT_MESSAGES["profile_no_active_missions"]
+    if active_missions:
+        missions_list = [f"• {mission.name} ({mission.points_reward} Puntos)" for mission in active_missions]
+        missions_text = BOT_MESSAGES["profile_active_missions_title"] + "\n" + "\n".join(missions_list)
+    return (
+        f"{BOT_MESSAGES['profile_title']}\n\n"
+        f"{BOT_MESSAGES['profile_points'].format(user_points=user.points)}\n"
+        f"{BOT_MESSAGES['profile_level'].format(user_level=user.level)}\n"
+        f"{points_to_next_level_text}\n\n"
+        f"{achievements_text}\n\n"
+        f"{missions_text}"
+    )
+
+
+def report(label: str, legacy: float, new: float):
+    print(f"{label:<22} legacy {REPEATS / legacy:10,.0f}/s   join {REPEATS / new:10,.0f}/s  ({legacy / new:.2f}x)")
+
+
+async def main():
+    for size in RANKING_SIZES:
+        entries = [LeaderboardEntry(i, f"user{i}" if i % 3 else None, f"Name{i}", 10_000 - i, 5) for i in range(size)]
+        assert legacy_ranking(entries) == await get_ranking_message(entries)
+
+        started = time.perf_counter()
+        for _ in range(REPEATS):
+            legacy_ranking(entries)
+        legacy = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for _ in range(REPEATS):
+            await get_ranking_message(entries)
+        report(f"ranking ({size} entries)", legacy, time.perf_counter() - started)
+
+    user = User(id=1, points=420, level=6)
+    missions = [Mission(id=f"m{i}", name=f"Desafío {i}", points_reward=5 * i) for i in range(MISSIONS)]
+    now = datetime.datetime.now()
+    achievements = {f"a{i}": {"name": f"Logro {i}", "icon": "🏅", "granted_at": now} for i in range(ACHIEVEMENTS)}
+    assert legacy_profile(user, missions, achievements) == await get_profile_message(user, missions, achievements)
+
+    started = time.perf_counter()
+    for _ in range(REPEATS):
+        legacy_profile(user, missions, achievements)
+    legacy = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(REPEATS):
+        await get_profile_message(user, missions, achievements)
+    report("profile", legacy, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,190 @@
+# benchmarks/bench_mission_completion.py
+"""
+Counts database round-trips for one mission completion through the complete_mission_ handler:
+the baseline services (copied below as they were before UnitOfWork, each call committing and
+refreshing on its own) against the handler's current single-transaction sequence. Only the
+database part of the handler is measured; the Telegram answers and the menu refresh after it
+are left out of both.
+
+Run from the repository root:
+    python -m benchmarks.bench_mission_completion
+"""
+import asyncio
+import datetime
+import os
+import tempfile
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from database.models import Base, User, Mission
+from services.level_service import get_level_threshold
+from services.unit_of_work import UnitOfWork
+
+USERS = 200
+
+
+class RoundTripCounter:
+    """Counts statements and commits issued through an engine."""
+
+    def __init__(self, engine):
+        self.statements = 0
+        self.commits = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+        event.listen(engine.sync_engine, "commit", self._on_commit)
+
+    def _on_execute(self, *args):
+        self.statements += 1
+
+    def _on_commit(self, *args):
+        self.commits += 1
+
+    def reset(self):
+        self.statements = 0
+        self.commits = 0
+
+
+# --- Servicios de la versión base (progreso en las columnas JSON de User) ---
+
+class LegacyPointService:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def add_points(self, user_id: int, points: int) -> User:
+        user = await self.session.get(User, user_id)
+        user.points += points
+        await self.session.commit()
+        await self.session.refresh(user)
+        return user
+
+
+class LegacyLevelService:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def check_for_level_up(self, user: User) -> bool:
+        leveled_up = False
+        while True:
+            points_for_next_level = get_level_threshold(user.level + 1)
+            if points_for_next_level == float('inf') or user.points < points_for_next_level:
+                break
+            user.level += 1
+            leveled_up = True
+        if leveled_up:
+            await self.session.commit()
+            await self.session.refresh(user)
+        return leveled_up
+
+
+class LegacyAchievementService:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def grant_achievement(self, user_id: int, achievement_id: str) -> bool:
+        user = await self.session.get(User, user_id)
+        if not user:
+            return False
+        if achievement_id not in user.achievements:
+            user.achievements[achievement_id] = datetime.datetime.now().isoformat()
+            await self.session.commit()
+            await self.session.refresh(user)
+            return True
+        return False
+
+
+class LegacyMissionService:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get_mission_by_id(self, mission_id: str) -> Mission | None:
+        return await self.session.get(Mission, mission_id)
+
+    async def check_mission_completion_status(self, user: User, mission: Mission) -> tuple[bool, str]:
+        if mission.type == "one_time" and user.missions_completed.get(mission.id):
+            return True, "already_completed"
+        return False, ""
+
+    async def complete_mission(self, user_id: int, mission_id: str) -> tuple[bool, Mission | None]:
+        user = await self.session.get(User, user_id)
+        mission = await self.session.get(Mission, mission_id)
+        if not user or not mission or not mission.is_active:
+            return False, None
+        is_completed, _ = await self.check_mission_completion_status(user, mission)
+        if is_completed:
+            return False, None
+        user.missions_completed[mission.id] = datetime.datetime.now().isoformat()
+        # La versión base leía self.point_service antes de su propio fallback (AttributeError); aquí se usa el fallback
+        await LegacyPointService(self.session).add_points(user_id, mission.points_reward)
+        self.session.add(user)
+        await self.session.commit()
+        await self.session.refresh(user)
+        return True, mission
+
+
+async def legacy_completion(session: AsyncSession, user_id: int, mission_id: str):
+    """Database part of the baseline complete_mission_ handler: every service call commits on its own."""
+    mission_service = LegacyMissionService(session)
+    point_service = LegacyPointService(session)
+    level_service = LegacyLevelService(session)
+    achievement_service = LegacyAchievementService(session)
+
+    user = await session.get(User, user_id)
+    mission = await mission_service.get_mission_by_id(mission_id)
+    is_completed_for_period, _ = await mission_service.check_mission_completion_status(user, mission)
+    if is_completed_for_period:
+        return
+    completed, completed_mission_obj = await mission_service.complete_mission(user_id, mission_id)
+    if completed:
+        # La versión base sumaba la recompensa dos veces: en complete_mission y aquí
+        updated_user = await point_service.add_points(user_id, completed_mission_obj.points_reward)
+        await level_service.check_for_level_up(updated_user)
+        if not user.missions_completed:
+            await achievement_service.grant_achievement(user_id, "first_mission")
+
+
+async def uow_completion(session: AsyncSession, user_id: int, mission_id: str):
+    """Database part of the current complete_mission_ handler."""
+    async with UnitOfWork(session) as uow:
+        user = await session.get(User, user_id)
+        mission = await uow.missions.get_mission_by_id(mission_id)
+        is_completed_for_period, _ = await uow.missions.check_mission_completion_status(user, mission)
+        if is_completed_for_period:
+            return
+        is_first_mission = not await uow.missions.has_completed_any(user_id)
+        completed, _, _ = await uow.missions.complete_mission(user_id, mission_id)
+        if completed:
+            await uow.levels.check_for_level_up(user)
+            if is_first_mission:
+                await uow.achievements.grant_achievement(user_id, "first_mission")
+
+
+async def run(label, flow, Session, counter, first_user_id):
+    counter.reset()
+    for user_id in range(first_user_id, first_user_id + USERS):
+        async with Session() as session:
+            await flow(session, user_id, "one_time_bench")
+    print(
+        f"{label:<12} {counter.statements / USERS:6.1f} statements/completion  "
+        f"{counter.commits / USERS:4.1f} commits/completion"
+    )
+
+
+async def main():
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    Session = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with Session() as session:
+        session.add(Mission(id="one_time_bench", name="Bench", points_reward=15, type="one_time"))
+        session.add_all(User(id=i, points=0, level=1, achievements={}, missions_completed={}) for i in range(1, 2 * USERS + 1))
+        await session.commit()
+
+    counter = RoundTripCounter(engine)
+    await run("legacy", legacy_completion, Session, counter, 1)
+    await run("unit of work", uow_completion, Session, counter, USERS + 1)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+# benchmarks/bench_mission_eligibility.py
+"""
+Microbenchmark of per-user mission eligibility: the previous loop that awaited one status
+check per mission and parsed ISO timestamps, against filter_eligible_missions.
+
+Run from the repository root:
+    python -m benchmarks.bench_mission_eligibility
+"""
+import asyncio
+import datetime
+import random
+import time
+
+from database.models import Mission
+from services.mission_service import build_eligibility_index, filter_eligible_missions
+
+MISSIONS = 1_000
+COMPLETIONS = 10_000
+REPEATS = 20
+TYPES = ["daily", "weekly", "one_time", "reaction", "event"]
+
+
+async def legacy_check(missions_completed: dict[str, str], mission: Mission) -> tuple[bool, str]:
+    """The status check as it used to run for every mission, parsing the JSON timestamp each time."""
+    record = missions_completed.get(mission.id)
+    if mission.type == "one_time":
+        if record:
+            return True, "already_completed"
+    elif mission.type == "daily":
+        if record and (datetime.datetime.now() - datetime.datetime.fromisoformat(record)) < datetime.timedelta(days=1):
+            return True, "daily_limit_reached"
+    elif mission.type == "weekly":
+        if record and (datetime.datetime.now() - datetime.datetime.fromisoformat(record)) < datetime.timedelta(weeks=1):
+            return True, "weekly_limit_reached"
+    elif mission.type == "reaction":
+        if record:
+            return True, "already_completed"
+    return False, ""
+
+
+async def legacy_filter(missions, missions_completed):
+    eligible = []
+    for mission in missions:
+        is_completed, _ = await legacy_check(missions_completed, mission)
+        if not is_completed:
+            eligible.append(mission)
+    return eligible
+
+
+async def main():
+    rng = random.Random(7)
+    now = datetime.datetime.now()
+    missions = [Mission(id=f"m{i}", name=f"M{i}", points_reward=5, type=rng.choice(TYPES)) for i in range(MISSIONS)]
+    # Completions include missions that are no longer in the active catalog
+    completions = {
+        f"m{i}": now - datetime.timedelta(hours=rng.randint(0, 24 * 14))
+        for i in rng.sample(range(COMPLETIONS * 2), COMPLETIONS)
+    }
+    iso_completions = {mission_id: completed_at.isoformat() for mission_id, completed_at in completions.items()}
+
+    # Built once per catalog load by the catalog cache
+    index = build_eligibility_index(missions)
+
+    legacy_result = await legacy_filter(missions, iso_completions)
+    batch_result = filter_eligible_missions(index, completions)
+    assert [m.id for m in legacy_result] == [m.id for m in batch_result]
+
+    started = time.perf_counter()
+    for _ in range(REPEATS):
+        await legacy_filter(missions, iso_completions)
+    legacy = (time.perf_counter() - started) / REPEATS
+
+    started = time.perf_counter()
+    for _ in range(REPEATS):
+        filter_eligible_missions(index, completions)
+    batch = (time.perf_counter() - started) / REPEATS
+
+    print(f"{MISSIONS} missions x {COMPLETIONS} completions, {len(batch_result)} eligible")
+    print(f"per-mission await loop   {legacy * 1000:8.3f} ms")
+    print(f"filter_eligible_missions {batch * 1000:8.3f} ms  ({legacy / batch:.1f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,18 +1,27 @@
 # bot.py
 import asyncio
 import logging
-import datetime
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
-from aiogram.fsm.storage.memory import MemoryStorage
-from sqlalchemy import select
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-from database.setup import get_session, init_db # Ahora init_db y get_session
-from database.models import Event
+from database.setup import get_session, init_db, get_pool_status, LazySession # Ahora init_db y get_session
+from database.migrations import migrate_json_to_tables, add_reaction_processed_at
+from database.fsm_storage import create_fsm_storage, SQLStorage
+from database.menu_state import menu_state_store
+from services.leaderboard_service import leaderboard
+from services.broadcast_service import broadcast_engine
+from services.season_service import season_rollover
+from services.reaction_pipeline import reaction_pipeline
+from services.event_service import event_lifecycle
+from services.post_stats_service import reaction_keyboard_updater
+from services.level_service import LevelService
 from config import Config
 from handlers import user_handlers, admin_handlers
+from webhook import run_webhook
+from middlewares.user_lock import UserLockMiddleware
+from utils.background import wait_background_tasks
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
@@ -27,24 +36,71 @@ async def main():
     Session = await get_session()
     # --- FIN CAMBIO DE OPTIMIZACIÓN ---
 
+    # Columna de reacciones procesadas en bases creadas antes del pipeline (idempotente)
+    await add_reaction_processed_at(Session)
+
+    # Mueve el progreso guardado en columnas JSON de User a las tablas normalizadas (idempotente)
+    await migrate_json_to_tables(Session)
+
+    # Carga el ranking en memoria; a partir de aquí se actualiza de forma incremental
+    async with Session() as s:
+        await leaderboard.rebuild(s)
+    logger.info(f"Leaderboard loaded with {len(leaderboard)} users.")
+
+    # Si la curva de niveles cambió desde el último arranque, sube de nivel a quien ya lo alcance
+    async with Session() as s:
+        level_service = LevelService(s)
+        if await level_service.sync_thresholds():
+            raised = await level_service.reconcile_levels()
+            logger.info(f"Level curve changed: {raised} users leveled up.")
+
     bot = Bot(
         token=Config.BOT_TOKEN,
         default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN)
     )
 
-    dp = Dispatcher(storage=MemoryStorage())
+    # Reanuda las difusiones que quedaron a medias y que ningún otro worker tiene reservadas
+    broadcast_engine.configure(Session, bot)
+    await broadcast_engine.resume_pending()
+    season_rollover.configure(Session, bot)
+    await season_rollover.resume_pending()
+    # Los puntos de las reacciones guardadas se suman por lotes; al apagar se procesan las pendientes
+    reaction_pipeline.configure(Session, bot)
+    reaction_pipeline.start()
+    reaction_keyboard_updater.configure(bot)
+    reaction_keyboard_updater.start()
+
+    # Estado FSM persistente y compartido entre procesos (Config.FSM_STORAGE)
+    storage = create_fsm_storage(Session)
+    dp = Dispatcher(storage=storage)
+    dp.shutdown.register(wait_background_tasks) # Exportaciones y ajustes de nivel lanzados por el admin
+    dp.shutdown.register(reaction_pipeline.stop)
+    dp.shutdown.register(reaction_keyboard_updater.stop)
+    dp.shutdown.register(menu_state_store.flush)
 
     # Registra los routers de handlers
     dp.include_router(user_handlers.router)
     dp.include_router(admin_handlers.router)
 
+    # Un update por usuario a la vez (evita premios dobles por toques repetidos); usuarios distintos siguen en paralelo.
+    # En dp.update envuelve al middleware de sesión, así el commit ocurre antes de liberar el turno.
+    user_lock = UserLockMiddleware()
+    dp.update.outer_middleware(user_lock)
+
     # Middleware para pasar la sesión de la base de datos y la instancia del bot a los handlers
     def session_and_bot_middleware_factory(session_factory, bot_instance):
         async def session_and_bot_middleware(handler, event, data):
-            async with session_factory() as session:
-                data['session'] = session
-                data['bot'] = bot_instance
-                return await handler(event, data)
+            # La sesión real solo se abre si el handler ejecuta alguna consulta
+            session = LazySession(session_factory)
+            data['session'] = session
+            data['bot'] = bot_instance
+            try:
+                result = await handler(event, data)
+            except Exception:
+                await session.finish(commit=False)
+                raise
+            await session.finish()
+            return result
         return session_and_bot_middleware
 
     dp.message.outer_middleware(session_and_bot_middleware_factory(Session, bot))
@@ -53,35 +109,68 @@ async def main():
     # Configura y programa tareas con APScheduler
     scheduler = AsyncIOScheduler()
 
-    async def check_active_events_and_notify(current_bot: Bot, current_session_factory):
+    # Retoma las difusiones cuyo worker dejó de renovar la reserva (caído o reiniciado)
+    scheduler.add_job(broadcast_engine.resume_pending, 'interval', seconds=Config.JOB_LEASE_SECONDS)
+    scheduler.add_job(season_rollover.resume_pending, 'interval', seconds=Config.JOB_LEASE_SECONDS)
+
+    # Cada evento termina con un job puntual en su end_time; la tabla de eventos es el almacén persistente
+    event_lifecycle.configure(scheduler, Session, bot)
+
+    async def report_pool_status():
         """
-        Función programada para revisar eventos activos y notificar.
+        Registra el tiempo de espera para obtener una conexión del pool, para dimensionarlo con tráfico real.
+        """
+        stats = get_pool_status()
+        logger.info(
+            f"DB pool ({stats['mode']}): {stats['checkouts']} checkouts, "
+            f"avg wait {stats['avg_wait_ms']:.2f} ms, max wait {stats['max_wait_ms']:.2f} ms. {stats['status']}"
+        )
+
+    async def refresh_leaderboard():
         """
-        async with current_session_factory() as s:
-            stmt = select(Event).where(Event.is_active == True)
-            result = await s.execute(stmt)
-            active_events = result.scalars().all()
-
-            for event in active_events:
-                # Desactiva eventos expirados
-                if event.end_time and event.end_time < datetime.datetime.now():
-                    event.is_active = False
-                    await s.commit()
-                    await current_bot.send_message(Config.CHANNEL_ID,
-                                                   f"📢 **¡Evento Finalizado!**\n\n"
-                                                   f"El evento '{event.name}' ha terminado.",
-                                                   parse_mode=ParseMode.MARKDOWN)
-                    logger.info(f"Event '{event.name}' deactivated.")
-                # Aquí podrías añadir lógica para notificar sobre eventos en curso periódicamente
-                # Por ejemplo, enviar recordatorios antes de que un evento termine.
-
-    # Programa la revisión de eventos cada hora
-    scheduler.add_job(check_active_events_and_notify, 'interval', hours=1, args=[bot, Session])
+        Recarga el ranking desde la base de datos: recoge los puntos sumados en otros procesos y los cierres de temporada.
+        """
+        async with Session() as s:
+            await leaderboard.rebuild(s)
+
+    if Config.LEADERBOARD_REFRESH_SECONDS > 0:
+        scheduler.add_job(refresh_leaderboard, 'interval', seconds=Config.LEADERBOARD_REFRESH_SECONDS)
+
+    # Guarda por lotes los cambios de estado del menú
+    menu_state_store.configure(Session)
+    scheduler.add_job(menu_state_store.flush, 'interval', seconds=Config.MENU_STATE_FLUSH_INTERVAL_SECONDS)
+
+    if isinstance(storage, SQLStorage):
+        # Borra los asistentes abandonados que ya caducaron
+        scheduler.add_job(storage.purge_expired, 'interval', hours=1)
+
+    if Config.DB_POOL_STATS_INTERVAL_MINUTES > 0:
+        scheduler.add_job(report_pool_status, 'interval', minutes=Config.DB_POOL_STATS_INTERVAL_MINUTES)
+
+    async def report_user_lock_status():
+        """
+        Registra cuánto esperan los updates a otros del mismo usuario y cuántos hay en vuelo.
+        """
+        stats = user_lock.get_status()
+        logger.info(
+            f"User locks: {stats['acquired']} updates, {stats['contended']} waited, "
+            f"avg wait {stats['avg_wait_ms']:.2f} ms, max wait {stats['max_wait_ms']:.2f} ms, "
+            f"max depth {stats['max_depth']}. In flight now: {stats['in_flight']} updates from {stats['users']} users."
+        )
+
+    if Config.USER_LOCK_STATS_INTERVAL_MINUTES > 0:
+        scheduler.add_job(report_user_lock_status, 'interval', minutes=Config.USER_LOCK_STATS_INTERVAL_MINUTES)
     scheduler.start()
+    await event_lifecycle.rehydrate()
 
-    logger.info("Bot starting...")
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    logger.info(f"Bot starting in {Config.BOT_MODE} mode...")
+    if Config.BOT_MODE == "webhook":
+        await run_webhook(dp, bot)
+    elif Config.BOT_MODE == "polling":
+        await bot.delete_webhook(drop_pending_updates=True)
+        await dp.start_polling(bot)
+    else:
+        raise ValueError(f"Unknown BOT_MODE '{Config.BOT_MODE}'. Use 'polling' or 'webhook'.")
     logger.info("Bot stopped.")
 
 if __name__ == "__main__":
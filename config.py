@@ -7,3 +7,76 @@ class Config:
 
     # URL de la base de datos
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///gamification.db")
+
+    # Pool de conexiones: "queue" reutiliza conexiones, "null" abre una por sesión (comportamiento anterior)
+    DB_POOL_MODE = os.getenv("DB_POOL_MODE", "queue")
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800")) # Segundos; -1 para no reciclar
+    DB_POOL_STATS_INTERVAL_MINUTES = int(os.getenv("DB_POOL_STATS_INTERVAL_MINUTES", "15")) # 0 para desactivar el reporte
+
+    # Caché de catálogos (misiones y recompensas activas); se invalida al editarlos desde el panel de admin
+    CATALOG_CACHE_TTL_SECONDS = int(os.getenv("CATALOG_CACHE_TTL_SECONDS", "300"))
+
+    # Ranking en memoria: cada cuánto se recarga de la base de datos para ver los cambios de otros procesos (0 para no recargar)
+    LEADERBOARD_REFRESH_SECONDS = float(os.getenv("LEADERBOARD_REFRESH_SECONDS", "60"))
+
+    # Perfiles ya generados: usuarios recordados y validez máxima (las misiones diarias/semanales dependen de la hora)
+    PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+    PROFILE_CACHE_TTL_SECONDS = float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "60"))
+
+    # Estado del menú: usuarios recordados en memoria y cada cuánto se guardan los cambios
+    MENU_STATE_CACHE_SIZE = int(os.getenv("MENU_STATE_CACHE_SIZE", "100000"))
+    MENU_STATE_FLUSH_INTERVAL_SECONDS = float(os.getenv("MENU_STATE_FLUSH_INTERVAL_SECONDS", "5"))
+    MENU_STATE_CACHE_TTL_SECONDS = float(os.getenv("MENU_STATE_CACHE_TTL_SECONDS", "60")) # Con varios procesos, vuelve a leer el estado guardado por otros
+
+    # Curva de niveles: "table" (LEVEL_CURVE_TABLE = puntos acumulados por nivel separados por comas,
+    # vacío para la tabla por defecto) o "formula" (BASE * (nivel - 1) ** EXPONENT hasta MAX_LEVEL)
+    LEVEL_CURVE = os.getenv("LEVEL_CURVE", "table")
+    LEVEL_CURVE_TABLE = os.getenv("LEVEL_CURVE_TABLE", "")
+    LEVEL_CURVE_BASE = float(os.getenv("LEVEL_CURVE_BASE", "10"))
+    LEVEL_CURVE_EXPONENT = float(os.getenv("LEVEL_CURVE_EXPONENT", "2"))
+    LEVEL_CURVE_MAX_LEVEL = int(os.getenv("LEVEL_CURVE_MAX_LEVEL", "1000"))
+
+    # Difusiones (notificar a todos los usuarios). Telegram admite ~30 mensajes/s por bot
+    BROADCAST_RATE_PER_SECOND = float(os.getenv("BROADCAST_RATE_PER_SECOND", "25"))
+    BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10")) # Envíos simultáneos en vuelo
+    BROADCAST_CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", "500")) # Destinatarios leídos por consulta y por punto de control
+    BROADCAST_PROGRESS_INTERVAL_SECONDS = float(os.getenv("BROADCAST_PROGRESS_INTERVAL_SECONDS", "5"))
+
+    # Trabajos en segundo plano (difusiones, cierre de temporada) con varios procesos: el dueño renueva
+    # su reserva cada tercio de este plazo; si deja de hacerlo, otro proceso lo retoma al caducar
+    JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+    # Exportación de usuarios: filas leídas y escritas por lote (la memoria no crece con el número de usuarios)
+    EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+
+    # Cierre de temporada: usuarios archivados y reseteados por transacción, y pausa entre lotes para no frenar el tráfico
+    SEASON_RESET_BATCH_SIZE = int(os.getenv("SEASON_RESET_BATCH_SIZE", "1000"))
+    SEASON_RESET_PAUSE_SECONDS = float(os.getenv("SEASON_RESET_PAUSE_SECONDS", "0.05"))
+
+    # Almacenamiento FSM: "memory" (un solo proceso), "sql" (la base de datos del bot) o "redis" (REDIS_URL, también KeyDB/Dragonfly)
+    FSM_STORAGE = os.getenv("FSM_STORAGE", "sql")
+    FSM_TTL_SECONDS = int(os.getenv("FSM_TTL_SECONDS", "86400")) # Un asistente abandonado caduca a las 24 h
+    REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+    # Modo de recepción de updates: "polling" o "webhook" (servidor aiohttp en PORT)
+    BOT_MODE = os.getenv("BOT_MODE", "polling")
+    WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "") # URL pública, p. ej. https://mi-app.herokuapp.com
+    WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "") # Telegram lo envía en cada petición; vacío para no comprobarlo
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+    WEBHOOK_BACKPRESSURE_TIMEOUT = float(os.getenv("WEBHOOK_BACKPRESSURE_TIMEOUT", "5")) # Espera con la cola llena antes de responder 503
+    WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+    PORT = int(os.getenv("PORT", "8080"))
+    UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "16")) # Updates de usuarios distintos procesados en paralelo
+    UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "100")) # Updates en espera por worker
+    USER_LOCK_STATS_INTERVAL_MINUTES = int(os.getenv("USER_LOCK_STATS_INTERVAL_MINUTES", "15")) # 0 para desactivar el reporte
+
+    # Reacciones al canal: se guardan por lotes cada N ms o al juntar REACTION_BATCH_SIZE
+    REACTION_FLUSH_INTERVAL_MS = int(os.getenv("REACTION_FLUSH_INTERVAL_MS", "200"))
+    REACTION_BATCH_SIZE = int(os.getenv("REACTION_BATCH_SIZE", "1000"))
+    # Pausa mínima entre ediciones de los contadores de los botones (Telegram limita las ediciones por chat)
+    REACTION_KEYBOARD_EDIT_INTERVAL_SECONDS = float(os.getenv("REACTION_KEYBOARD_EDIT_INTERVAL_SECONDS", "3"))
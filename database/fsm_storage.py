@@ -0,0 +1,105 @@
+# database/fsm_storage.py
+import copy
+import datetime
+import logging
+from typing import Any, Mapping
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType, DefaultKeyBuilder, KeyBuilder
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from database.models import FsmState
+from database.setup import dialect_insert
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class SQLStorage(BaseStorage):
+    """aiogram FSM storage in the fsm_state table, shared by every worker; rows expire ttl_seconds after their last write."""
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        ttl_seconds: int = None,
+        key_builder: KeyBuilder = None,
+    ):
+        self._session_factory = session_factory
+        self.ttl = datetime.timedelta(seconds=ttl_seconds if ttl_seconds is not None else Config.FSM_TTL_SECONDS)
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self.key_builder.build(key)
+        _, data = await self._read(storage_key)
+        await self._write(storage_key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        state, _ = await self._read(self.key_builder.build(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        storage_key = self.key_builder.build(key)
+        state, _ = await self._read(storage_key)
+        await self._write(storage_key, state, copy.deepcopy(dict(data)))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, data = await self._read(self.key_builder.build(key))
+        return copy.deepcopy(data)
+
+    async def close(self) -> None:
+        pass
+
+    async def _read(self, storage_key: str) -> tuple[str | None, dict]:
+        async with self._session_factory() as session:
+            row = (await session.execute(
+                select(FsmState.state, FsmState.data)
+                .where(FsmState.key == storage_key, FsmState.expires_at > datetime.datetime.now())
+            )).first()
+        if row is None:
+            return None, {}
+        return row.state, dict(row.data or {})
+
+    async def _write(self, storage_key: str, state: str | None, data: dict):
+        # Se escribe al momento: el siguiente update del usuario puede llegar a otro proceso
+        async with self._session_factory() as session:
+            if state is None and not data:
+                # Sin estado ni datos: el asistente terminó (state.clear()), la fila sobra
+                await session.execute(delete(FsmState).where(FsmState.key == storage_key))
+            else:
+                stmt = dialect_insert(session, FsmState).values(
+                    key=storage_key, state=state, data=data, expires_at=datetime.datetime.now() + self.ttl
+                )
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[FsmState.key],
+                    set_={"state": stmt.excluded.state, "data": stmt.excluded.data, "expires_at": stmt.excluded.expires_at},
+                )
+                await session.execute(stmt)
+            await session.commit()
+
+    async def purge_expired(self) -> int:
+        """Deletes expired rows. Returns how many were removed."""
+        async with self._session_factory() as session:
+            result = await session.execute(delete(FsmState).where(FsmState.expires_at <= datetime.datetime.now()))
+            await session.commit()
+        return result.rowcount
+
+
+def create_fsm_storage(session_factory: async_sessionmaker[AsyncSession]) -> BaseStorage:
+    """Builds the FSM storage selected by Config.FSM_STORAGE."""
+    if Config.FSM_STORAGE == "memory":
+        # Solo válido con un único proceso: los asistentes se pierden al reiniciar
+        return MemoryStorage()
+    if Config.FSM_STORAGE == "sql":
+        return SQLStorage(session_factory)
+    if Config.FSM_STORAGE == "redis":
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError as e:
+            raise RuntimeError("FSM_STORAGE=redis requires the 'redis' package (pip install redis).") from e
+        return RedisStorage.from_url(
+            Config.REDIS_URL,
+            key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True),
+            state_ttl=Config.FSM_TTL_SECONDS,
+            data_ttl=Config.FSM_TTL_SECONDS,
+        )
+    raise ValueError(f"Unknown FSM_STORAGE '{Config.FSM_STORAGE}'. Use 'memory', 'sql' or 'redis'.")
@@ -0,0 +1,82 @@
+# database/menu_state.py
+import logging
+import time
+from collections import OrderedDict
+from sqlalchemy import select, update, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from database.models import User
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MENU_STATE = "root"
+
+_users_table = User.__table__
+_SET_MENU_STATE = update(_users_table).where(_users_table.c.id == bindparam("user_id")).values(menu_state=bindparam("state"))
+
+
+class MenuStateStore:
+    """
+    Users' menu state ("root", "profile", "missions"...) kept in a bounded in-process LRU.
+
+    Reads hit the database only on a cache miss, and then select the single column. Writes only
+    touch memory: changed states are recorded in a separate dirty map (so LRU eviction never
+    drops an unsaved state) and flush() writes them all in one executemany UPDATE, on a timer
+    and at shutdown. A crash loses at most one flush interval of navigation state, which only
+    affects where the "back" button leads. With several workers a cached state may have been
+    changed by another one; it is re-read once it is older than ttl_seconds.
+    """
+
+    def __init__(self, capacity: int, ttl_seconds: float):
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self._states: OrderedDict[int, tuple[str, float]] = OrderedDict() # (estado, momento en que se leyó o escribió)
+        self._dirty: dict[int, str] = {}
+        self._session_factory: async_sessionmaker[AsyncSession] = None
+
+    def configure(self, session_factory: async_sessionmaker[AsyncSession]):
+        self._session_factory = session_factory
+
+    def _remember(self, user_id: int, state: str):
+        self._states[user_id] = (state, time.monotonic())
+        self._states.move_to_end(user_id)
+        if len(self._states) > self.capacity:
+            self._states.popitem(last=False)
+
+    async def get(self, session: AsyncSession, user_id: int) -> str:
+        state = self._dirty.get(user_id)
+        if state is not None:
+            return state
+        cached = self._states.get(user_id)
+        if cached is not None and time.monotonic() - cached[1] < self.ttl_seconds:
+            self._states.move_to_end(user_id)
+            return cached[0]
+        state = await session.scalar(select(User.menu_state).where(User.id == user_id)) or DEFAULT_MENU_STATE
+        self._remember(user_id, state)
+        return state
+
+    def set(self, user_id: int, state: str):
+        cached = self._states.get(user_id)
+        if self._dirty.get(user_id, cached and cached[0]) == state:
+            return # Sin cambios: nada que escribir
+        self._remember(user_id, state)
+        self._dirty[user_id] = state
+
+    async def flush(self) -> int:
+        """Writes every changed state in one statement. Returns how many users were written."""
+        if not self._dirty:
+            return 0
+        dirty, self._dirty = self._dirty, {}
+        try:
+            async with self._session_factory() as session:
+                await session.execute(_SET_MENU_STATE, [{"user_id": user_id, "state": state} for user_id, state in dirty.items()])
+                await session.commit()
+        except Exception:
+            # Se reintenta en el siguiente flush sin pisar estados más recientes
+            for user_id, state in dirty.items():
+                self._dirty.setdefault(user_id, state)
+            raise
+        return len(dirty)
+
+
+menu_state_store = MenuStateStore(Config.MENU_STATE_CACHE_SIZE, Config.MENU_STATE_CACHE_TTL_SECONDS)
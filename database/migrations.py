@@ -0,0 +1,113 @@
+# database/migrations.py
+import datetime
+import logging
+from sqlalchemy import select, update, cast, String, or_, and_, inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from database.models import User, UserMissionCompletion, UserAchievement, ChannelReaction
+from database.setup import dialect_insert
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+_EMPTY_JSON = ("{}", "null")
+
+
+def _has_data(column):
+    """True when a legacy JSON column holds something other than an empty dict."""
+    return and_(column.is_not(None), cast(column, String).not_in(_EMPTY_JSON))
+
+
+def _parse_timestamp(value) -> datetime.datetime:
+    # Los blobs antiguos guardan timestamps ISO o simplemente True (reacciones)
+    if isinstance(value, str):
+        try:
+            return datetime.datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    return datetime.datetime.now()
+
+
+async def _insert_ignore(session: AsyncSession, model, rows: list[dict]):
+    if rows:
+        await session.execute(dialect_insert(session, model).on_conflict_do_nothing(), rows)
+
+
+async def migrate_json_to_tables(session_factory: async_sessionmaker[AsyncSession]) -> int:
+    """
+    Moves User.missions_completed, User.achievements and User.channel_reactions into the
+    normalized tables, in batches of users, and empties the JSON columns it copied.
+    Idempotent: once migrated, the filter matches no rows and startup pays a single query.
+    Returns the number of users migrated.
+    """
+    migrated = 0
+    last_id = None
+    async with session_factory() as session:
+        while True:
+            stmt = (
+                select(User.id, User.missions_completed, User.achievements, User.channel_reactions)
+                .where(or_(
+                    _has_data(User.missions_completed),
+                    _has_data(User.achievements),
+                    _has_data(User.channel_reactions),
+                ))
+                .order_by(User.id)
+                .limit(BATCH_SIZE)
+            )
+            if last_id is not None:
+                stmt = stmt.where(User.id > last_id)
+            rows = (await session.execute(stmt)).all()
+            if not rows:
+                break
+
+            completions, achievements, reactions = [], [], []
+            for user_id, missions_completed, user_achievements, channel_reactions in rows:
+                for mission_id, completed_at in (missions_completed or {}).items():
+                    completions.append({"user_id": user_id, "mission_id": mission_id, "completed_at": _parse_timestamp(completed_at)})
+                for achievement_id, granted_at in (user_achievements or {}).items():
+                    achievements.append({"user_id": user_id, "achievement_id": achievement_id, "granted_at": _parse_timestamp(granted_at)})
+                for message_id, reacted_at in (channel_reactions or {}).items():
+                    reacted_at = _parse_timestamp(reacted_at)
+                    # Ya pagadas con el sistema anterior: el pipeline no debe volver a sumarlas
+                    reactions.append({"user_id": user_id, "message_id": int(message_id), "reaction_type": None, "created_at": reacted_at, "processed_at": reacted_at})
+
+            await _insert_ignore(session, UserMissionCompletion, completions)
+            await _insert_ignore(session, UserAchievement, achievements)
+            await _insert_ignore(session, ChannelReaction, reactions)
+
+            user_ids = [row[0] for row in rows]
+            await session.execute(
+                update(User)
+                .where(User.id.in_(user_ids))
+                .values(missions_completed={}, achievements={}, channel_reactions={})
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+
+            migrated += len(rows)
+            last_id = user_ids[-1]
+
+    if migrated:
+        logger.info(f"Migrated legacy JSON progress of {migrated} users into normalized tables.")
+    return migrated
+
+
+async def add_reaction_processed_at(session_factory: async_sessionmaker[AsyncSession]) -> bool:
+    """
+    Adds channel_reaction.processed_at to databases created before the reaction pipeline read
+    its work from that table. Existing reactions were already paid, so they are marked as
+    processed. Idempotent: returns False when the column already exists.
+    """
+    async with session_factory() as session:
+        conn = await session.connection()
+        columns = await conn.run_sync(lambda sync_conn: {c["name"] for c in inspect(sync_conn).get_columns("channel_reaction")})
+        if "processed_at" in columns:
+            return False
+        column_type = ChannelReaction.processed_at.type.compile(dialect=conn.dialect)
+        await conn.execute(text(f"ALTER TABLE channel_reaction ADD COLUMN processed_at {column_type}"))
+        await conn.execute(update(ChannelReaction).values(processed_at=ChannelReaction.created_at))
+        for index in ChannelReaction.__table__.indexes:
+            if index.name == "ix_channel_reaction_pending":
+                await conn.run_sync(lambda sync_conn: index.create(sync_conn, checkfirst=True))
+        await session.commit()
+    logger.info("Added channel_reaction.processed_at; existing reactions marked as processed.")
+    return True
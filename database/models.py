@@ -1,9 +1,8 @@
 # database/models.py
-from sqlalchemy import Column, Integer, String, BigInteger, DateTime, Boolean, JSON, Text
+from sqlalchemy import Column, Integer, String, BigInteger, DateTime, Boolean, JSON, Text, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from sqlalchemy.ext.asyncio import AsyncAttrs
-from sqlalchemy.future import select
 
 Base = declarative_base()
 
@@ -15,6 +14,8 @@ class User(AsyncAttrs, Base):
     last_name = Column(String, nullable=True)
     points = Column(Integer, default=0)
     level = Column(Integer, default=1)
+    # Legacy: superseded by UserAchievement / UserMissionCompletion. database/migrations.py moves
+    # existing data into those tables at startup and leaves these columns empty.
     achievements = Column(JSON, default={}) # {'achievement_id': timestamp_isoformat}
     missions_completed = Column(JSON, default={}) # {'mission_id': timestamp_isoformat}
     # Track last reset for daily/weekly missions
@@ -26,12 +27,42 @@ class User(AsyncAttrs, Base):
     # ¡NUEVA COLUMNA para el estado del menú!
     menu_state = Column(String, default="root") # e.g., "root", "profile", "missions", "rewards"
 
-    # ¡NUEVA COLUMNA para registrar reacciones a mensajes del canal!
-    # Guarda un diccionario donde la clave es el message_id del canal y el valor es un booleano (True)
-    # o el timestamp de la reacción para futura expansión si necesitamos historial.
-    # Por ahora, un simple booleano es suficiente para registrar si el usuario ya reaccionó a ese mensaje.
+    # Legacy: superseded by ChannelReaction (migrado al arrancar, ver database/migrations.py).
+    # Guardaba un diccionario donde la clave es el message_id del canal y el valor True o el timestamp.
     channel_reactions = Column(JSON, default={}) # {'message_id': True}
 
+class UserMissionCompletion(AsyncAttrs, Base):
+    """Last completion of a mission by a user. Daily/weekly missions overwrite completed_at."""
+    __tablename__ = "user_mission_completion"
+    user_id = Column(BigInteger, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    mission_id = Column(String, primary_key=True)
+    completed_at = Column(DateTime, nullable=False, default=func.now())
+
+class UserAchievement(AsyncAttrs, Base):
+    __tablename__ = "user_achievement"
+    user_id = Column(BigInteger, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    achievement_id = Column(String, primary_key=True)
+    granted_at = Column(DateTime, nullable=False, default=func.now())
+
+class ChannelReaction(AsyncAttrs, Base):
+    """One row per user and channel post; the primary key makes "already reacted?" a point lookup."""
+    __tablename__ = "channel_reaction"
+    user_id = Column(BigInteger, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    message_id = Column(BigInteger, primary_key=True)
+    reaction_type = Column(String, nullable=True) # 'like', 'dislike' o None para datos migrados
+    created_at = Column(DateTime, nullable=False, default=func.now())
+    processed_at = Column(DateTime, nullable=True) # NULL hasta que el pipeline de reacciones suma sus puntos
+
+class ChannelPostStats(AsyncAttrs, Base):
+    # Contadores por publicación del canal, actualizados al guardar cada lote de reacciones
+    __tablename__ = "channel_post_stats"
+    message_id = Column(BigInteger, primary_key=True)
+    chat_id = Column(BigInteger, nullable=False)
+    likes = Column(Integer, default=0)
+    dislikes = Column(Integer, default=0)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
 class Reward(AsyncAttrs, Base):
     __tablename__ = "rewards"
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -66,19 +97,115 @@ class Event(AsyncAttrs, Base):
     end_time = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=func.now())
 
+class Broadcast(AsyncAttrs, Base):
+    # Difusión a todos los usuarios; last_user_id es el punto de control para reanudarla tras un reinicio
+    __tablename__ = "broadcasts"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    text = Column(Text, nullable=False)
+    status = Column(String, default="running") # 'running', 'done', 'cancelled'
+    admin_chat_id = Column(BigInteger, nullable=False)
+    progress_message_id = Column(BigInteger, nullable=True) # Mensaje del admin que se edita con el progreso
+    last_user_id = Column(BigInteger, default=0) # Último User.id procesado (los usuarios se recorren por id ascendente)
+    total = Column(Integer, default=0)
+    sent = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    owner = Column(String, nullable=True) # Proceso que la está enviando (services/job_lease.py)
+    heartbeat = Column(DateTime, nullable=True) # Última renovación del dueño; si caduca, otro proceso la retoma
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    finished_at = Column(DateTime, nullable=True)
+
+class Season(AsyncAttrs, Base):
+    # Cierre de temporada; last_user_id es el punto de control del reseteo por lotes
+    __tablename__ = "seasons"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    status = Column(String, default="running") # 'running', 'done'
+    admin_chat_id = Column(BigInteger, nullable=True)
+    progress_message_id = Column(BigInteger, nullable=True)
+    last_user_id = Column(BigInteger, default=0) # Último User.id archivado y reseteado (orden ascendente)
+    total = Column(Integer, default=0)
+    processed = Column(Integer, default=0)
+    owner = Column(String, nullable=True) # Proceso que ejecuta el reseteo (services/job_lease.py)
+    heartbeat = Column(DateTime, nullable=True)
+    started_at = Column(DateTime, default=func.now())
+    finished_at = Column(DateTime, nullable=True)
+
+class SeasonArchive(AsyncAttrs, Base):
+    # Clasificación final de cada usuario en una temporada cerrada
+    __tablename__ = "season_archive"
+    season_id = Column(Integer, ForeignKey("seasons.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(BigInteger, primary_key=True) # Sin FK: el archivo sobrevive a usuarios borrados
+    points = Column(Integer, default=0)
+    level = Column(Integer, default=1)
+    archived_at = Column(DateTime, default=func.now())
+
+class FsmState(AsyncAttrs, Base):
+    # Estado FSM de aiogram compartido entre procesos (ver database/fsm_storage.py)
+    __tablename__ = "fsm_state"
+    key = Column(String, primary_key=True) # fsm:<bot_id>:<chat_id>:<user_id>[:<thread_id>]:<destiny>
+    state = Column(String, nullable=True)
+    data = Column(JSON, default={})
+    expires_at = Column(DateTime, nullable=False)
+
+class LevelThreshold(AsyncAttrs, Base):
+    # Copia de la curva de niveles activa (services/level_service.py) para calcular niveles en SQL
+    __tablename__ = "level_thresholds"
+    level = Column(Integer, primary_key=True)
+    points = Column(BigInteger, nullable=False, unique=True) # Puntos acumulados para alcanzar el nivel
+
+
+# Índices secundarios para las rutas de acceso más frecuentes.
+# En despliegues existentes create_all no los añade a tablas ya creadas: init_db() avisa de los que falten.
+# Ranking: ORDER BY points DESC, id DESC. Ambas columnas en el mismo sentido para que la
+# paginación por keyset pueda usar una comparación de filas (points, id) < (:p, :id) sobre el índice.
+Index("ix_users_points_id_desc", User.points.desc(), User.id.desc())
+# Búsqueda de usuarios por @username sin distinguir mayúsculas (solo la coincidencia exacta)
+Index("ix_users_username_lower", func.lower(User.username))
+
+
+def _pg_trgm_installed(ddl, target, bind, **kw) -> bool:
+    return bind.dialect.name == "postgresql" and bind.exec_driver_sql(
+        "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+    ).first() is not None
+
+
+# Búsqueda por subcadena del panel de admin (ILIKE '%texto%' en username, first_name y last_name): índices
+# de trigramas, solo en PostgreSQL con la extensión pg_trgm. En SQLite esa búsqueda sigue recorriendo la tabla.
+for _column in (User.username, User.first_name, User.last_name):
+    Index(
+        f"ix_users_{_column.key}_trgm",
+        _column,
+        postgresql_using="gin",
+        postgresql_ops={_column.key: "gin_trgm_ops"},
+        info={"dialect": "postgresql"},
+    ).ddl_if(callable_=_pg_trgm_installed)
+# Catálogos: WHERE is_active = true [AND type = ...]
+Index("ix_missions_active_type", Mission.is_active, Mission.type)
+Index("ix_rewards_active", Reward.is_active)
+Index("ix_events_active", Event.is_active)
+# Difusiones pendientes de reanudar al arrancar
+Index("ix_broadcasts_status", Broadcast.status)
+# Clasificación de una temporada archivada
+Index("ix_season_archive_standings", SeasonArchive.season_id, SeasonArchive.points.desc(), SeasonArchive.user_id.desc())
+# Reacciones pendientes de procesar (índice parcial: solo las filas con processed_at NULL)
+Index(
+    "ix_channel_reaction_pending",
+    ChannelReaction.created_at,
+    postgresql_where=ChannelReaction.processed_at.is_(None),
+    sqlite_where=ChannelReaction.processed_at.is_(None),
+)
+# Purga de estados FSM caducados
+Index("ix_fsm_state_expires_at", FsmState.expires_at)
+
 
 # Funciones para manejar el estado del menú del usuario
+# El estado del menú se sirve desde memoria y se guarda por lotes (database/menu_state.py).
+# Import local: menu_state importa este módulo.
 async def get_user_menu_state(session, user_id: int) -> str:
-    result = await session.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
-    if user and user.menu_state:
-        return user.menu_state
-    return "root"
+    from database.menu_state import menu_state_store
+    return await menu_state_store.get(session, user_id)
 
 async def set_user_menu_state(session, user_id: int, state: str):
-    user = await session.get(User, user_id)
-    if user:
-        user.menu_state = state
-        await session.commit()
-        await session.refresh(user)
+    from database.menu_state import menu_state_store
+    menu_state_store.set(user_id, state) # Sin escritura síncrona: se persiste en el siguiente flush
 
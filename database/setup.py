@@ -1,20 +1,120 @@
 # database/setup.py
+import time
+import logging
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.pool import NullPool # NullPool es adecuado para Railway, para SQLite local puedes mantenerlo o quitarlo
+from sqlalchemy.pool import NullPool, AsyncAdaptedQueuePool
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy import text
 from database.models import Base
 from config import Config
 
+logger = logging.getLogger(__name__)
+
 # Hacemos que el motor sea una variable global o pasada, no creada repetidamente
 _engine = None # Variable para almacenar el motor una vez inicializado
 
+
+class PoolStats:
+    """Accumulates how long sessions wait to check out a pooled connection."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float):
+        self.checkouts += 1
+        self.total_wait += wait
+        if wait > self.max_wait:
+            self.max_wait = wait
+
+    def snapshot(self) -> dict:
+        avg_wait = self.total_wait / self.checkouts if self.checkouts else 0.0
+        return {
+            "checkouts": self.checkouts,
+            "avg_wait_ms": avg_wait * 1000,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+
+pool_stats = PoolStats()
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records the checkout wait time of every connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_stats.record(time.perf_counter() - started)
+
+
+def _pool_kwargs() -> dict:
+    """Builds the pool arguments for create_async_engine from Config."""
+    if Config.DB_POOL_MODE == "null":
+        # NullPool abre y cierra una conexión por sesión (útil detrás de un pooler externo como PgBouncer)
+        return {"poolclass": NullPool}
+    if Config.DB_POOL_MODE != "queue":
+        raise ValueError(f"Unknown DB_POOL_MODE '{Config.DB_POOL_MODE}'. Use 'queue' or 'null'.")
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": Config.DB_POOL_SIZE,
+        "max_overflow": Config.DB_MAX_OVERFLOW,
+        "pool_timeout": Config.DB_POOL_TIMEOUT,
+        "pool_pre_ping": Config.DB_POOL_PRE_PING,
+        "pool_recycle": Config.DB_POOL_RECYCLE,
+    }
+
 async def init_db():
     global _engine
     if _engine is None: # Solo crear el motor si no existe
-        _engine = create_async_engine(Config.DATABASE_URL, echo=False, poolclass=NullPool)
+        _engine = create_async_engine(Config.DATABASE_URL, echo=False, **_pool_kwargs())
+        if _engine.dialect.name == "postgresql":
+            await _create_pg_trgm(_engine)
         async with _engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            await report_missing_indexes(conn)
     return _engine
 
+async def _create_pg_trgm(engine):
+    """Enables pg_trgm for the admin search indexes; without privileges the search just scans the table."""
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except Exception as e:
+        logger.warning(f"Could not enable the pg_trgm extension, admin user search will not be indexed: {e}")
+
+async def find_missing_indexes(conn) -> list:
+    """
+    Returns the indexes declared in the models that do not exist in the database.
+    Compares by name, because expression indexes (lower(username)) are not reflected by SQLite.
+    """
+    if conn.dialect.name == "postgresql":
+        result = await conn.execute(text("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()"))
+    else:
+        result = await conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))
+    existing = {row[0] for row in result}
+    return [
+        index
+        for table in Base.metadata.sorted_tables
+        for index in table.indexes
+        if index.name not in existing and index.info.get("dialect", conn.dialect.name) == conn.dialect.name
+    ]
+
+async def report_missing_indexes(conn):
+    """Logs a warning with the DDL for every model index missing in an existing deployment."""
+    missing = await find_missing_indexes(conn)
+    for index in missing:
+        ddl = str(CreateIndex(index).compile(dialect=conn.dialect)).strip()
+        logger.warning(f"Missing database index {index.name}. Create it with: {ddl};")
+    return missing
+
 async def get_session() -> async_sessionmaker[AsyncSession]:
     # get_session ya no llamará a init_db directamente
     # Asume que init_db ya fue llamado en el inicio de la app y _engine está disponible
@@ -22,3 +122,57 @@ async def get_session() -> async_sessionmaker[AsyncSession]:
         raise RuntimeError("Database engine not initialized. Call init_db() first.")
     async_session = async_sessionmaker(bind=_engine, class_=AsyncSession, expire_on_commit=False)
     return async_session
+
+def dialect_insert(session, model):
+    """
+    Returns the dialect-specific insert() for model, which supports on_conflict_do_nothing()
+    and on_conflict_do_update() on both PostgreSQL and SQLite.
+    """
+    if session.bind.dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+class LazySession:
+    """
+    Stand-in for an AsyncSession that only creates the real session the first time a handler uses it.
+    Handlers that never touch the database (menus, admin placeholders) cost no session and no connection.
+    The middleware calls finish() once at the end of the update to commit pending work and close.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession]):
+        self._session_factory = session_factory
+        self._session = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._session is not None
+
+    def __getattr__(self, name):
+        # Solo se llama para atributos que no existen en el proxy: delega en la sesión real, creándola si hace falta.
+        if self._session is None:
+            self._session = self._session_factory()
+        return getattr(self._session, name)
+
+    async def finish(self, commit: bool = True):
+        """Commits any pending work (unless commit is False) and closes the real session, if one was opened."""
+        if self._session is None:
+            return
+        session = self._session
+        self._session = None
+        try:
+            has_pending = session.new or session.dirty or session.deleted
+            if commit and (has_pending or session.in_transaction()):
+                await session.commit()
+        finally:
+            await session.close()
+
+def get_pool_status() -> dict:
+    """
+    Returns the checkout wait statistics collected since the last call, plus the pool status line.
+    Statistics are reset on every call so each report covers one interval.
+    """
+    stats = pool_stats.snapshot()
+    pool_stats.reset()
+    stats["mode"] = Config.DB_POOL_MODE
+    stats["status"] = _engine.pool.status() if _engine is not None else "not initialized"
+    return stats
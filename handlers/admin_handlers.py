@@ -1,22 +1,25 @@
 # handlers/admin_handlers.py - Bloque 1 de 2
-import json
-import csv
-import io
+import os
 import datetime
 
 from aiogram import Router, F, Bot # Asegúrate de que Bot esté importado
-from aiogram.types import Message, CallbackQuery, InputFile
+from aiogram.types import Message, CallbackQuery, FSInputFile
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, func
+from sqlalchemy import select, func
 from database.models import User, Reward, Mission, Event
 from services.point_service import PointService
 from services.reward_service import RewardService
 from services.mission_service import MissionService
-from services.level_service import LevelService # Not directly used here, but good to have
+from services.level_service import LevelService, level_curve
+from services.broadcast_service import broadcast_engine
+from services.export_service import ExportService, available_export_formats
+from services.season_service import season_rollover
+from services.post_stats_service import PostStatsService
+from services.event_service import active_events, event_lifecycle
 from utils.keyboard_utils import (
     get_admin_main_keyboard,
     get_main_menu_keyboard,
@@ -25,13 +28,18 @@ from utils.keyboard_utils import (
     get_admin_content_missions_keyboard,
     get_admin_content_badges_keyboard,
     get_admin_content_levels_keyboard,
+    get_admin_adjust_levels_keyboard,
     get_admin_content_rewards_keyboard,
     get_admin_content_auctions_keyboard,
     get_admin_content_daily_gifts_keyboard,
     get_back_keyboard,
     get_admin_users_list_keyboard,
+    get_broadcast_progress_keyboard,
+    get_export_format_keyboard,
 )
-from utils.message_utils import get_profile_message
+from utils.message_utils import get_cached_profile_message
+from utils.background import run_in_background
+from database.setup import get_session
 from config import Config
 import logging # <--- NUEVA IMPORTACIÓN
 
@@ -202,16 +210,14 @@ async def admin_process_view_user(message: Message, state: FSMContext, session:
     if identifier.isdigit():
         user = await session.get(User, int(identifier))
     elif identifier.startswith('@'):
-        stmt = select(User).where(User.username == identifier[1:])
+        stmt = select(User).where(func.lower(User.username) == identifier[1:].lower()) # Usa ix_users_username_lower
         result = await session.execute(stmt)
         user = result.scalar_one_or_none()
 
     if not user:
         await message.answer("Usuario no encontrado.")
     else:
-        mission_service = MissionService(session)
-        active_missions = await mission_service.get_active_missions(user_id=user.id)
-        profile_text = await get_profile_message(user, active_missions)
+        profile_text = await get_cached_profile_message(session, user.id, user)
         await message.answer(profile_text, parse_mode="Markdown")
     await state.clear()
 
@@ -257,13 +263,10 @@ async def admin_quick_view_profile(callback: CallbackQuery, session: AsyncSessio
         return
 
     user_id = int(callback.data.split("_")[-1])
-    user = await session.get(User, user_id)
-    if not user:
+    profile_text = await get_cached_profile_message(session, user_id)
+    if not profile_text:
         await callback.answer("Usuario no encontrado", show_alert=True)
         return
-    mission_service = MissionService(session)
-    active_missions = await mission_service.get_active_missions(user_id=user.id)
-    profile_text = await get_profile_message(user, active_missions)
     await callback.message.answer(profile_text, parse_mode="Markdown")
     await callback.answer()
 
@@ -324,20 +327,27 @@ async def admin_notify_users(callback: CallbackQuery, state: FSMContext):
 async def admin_process_notify_users(message: Message, state: FSMContext, session: AsyncSession, bot: Bot):
     if message.from_user.id != Config.ADMIN_ID:
         return
-    text = message.text
-    stmt = select(User.id)
-    result = await session.execute(stmt)
-    user_ids = [row[0] for row in result.all()]
-    sent = 0
-    for uid in user_ids:
-        try:
-            await bot.send_message(uid, text)
-            sent += 1
-        except Exception as e:
-            logger.warning(f"No se pudo enviar notificación a {uid}: {e}")
-    await message.answer(f"Notificación enviada a {sent} usuarios.", reply_markup=get_admin_main_keyboard())
+    # El envío corre en segundo plano; este mensaje se edita con el progreso
+    progress = await message.answer("📢 Preparando notificación...")
+    broadcast = await broadcast_engine.start(session, message.chat.id, message.text, progress.message_id)
+    await progress.edit_reply_markup(reply_markup=get_broadcast_progress_keyboard(broadcast.id))
+    await message.answer(
+        f"Notificación en curso para {broadcast.total} usuarios. Puedes seguir usando el panel.",
+        reply_markup=get_admin_main_keyboard(),
+    )
     await state.clear()
 
+@router.callback_query(F.data.startswith("admin_broadcast_cancel:"))
+async def admin_broadcast_cancel(callback: CallbackQuery, session: AsyncSession):
+    if callback.from_user.id != Config.ADMIN_ID:
+        await callback.answer("Acceso denegado", show_alert=True)
+        return
+    broadcast_id = int(callback.data.split(":")[1])
+    if await broadcast_engine.cancel(session, broadcast_id):
+        await callback.answer("Cancelando envío...")
+    else:
+        await callback.answer("Este envío ya no está en curso.", show_alert=True)
+
 
 @router.callback_query(F.data == "admin_manage_content")
 async def admin_manage_content(callback: CallbackQuery):
@@ -479,17 +489,47 @@ async def admin_manage_badges(callback: CallbackQuery):
 
 
 @router.callback_query(F.data == "admin_adjust_levels")
-async def admin_adjust_levels(callback: CallbackQuery):
+async def admin_adjust_levels(callback: CallbackQuery, session: AsyncSession):
     if callback.from_user.id != Config.ADMIN_ID:
         await callback.answer("Acceso denegado", show_alert=True)
         return
+    # Vista previa: solo cuenta los usuarios cuyos puntos alcanzan un nivel mayor que el guardado
+    pending = await LevelService(session).reconcile_levels(dry_run=True)
     await callback.message.edit_text(
-        "Funcionalidad en desarrollo.",
-        reply_markup=get_admin_content_levels_keyboard(),
+        f"🧩 **Ajustar Niveles**\n\n"
+        f"La curva actual tiene {level_curve.max_level} niveles.\n"
+        f"Usuarios con puntos para subir de nivel: {pending}",
+        reply_markup=get_admin_adjust_levels_keyboard(pending),
+        parse_mode="Markdown",
     )
     await callback.answer()
 
 
+@router.callback_query(F.data == "admin_adjust_levels_confirm")
+async def admin_adjust_levels_confirm(callback: CallbackQuery):
+    if callback.from_user.id != Config.ADMIN_ID:
+        await callback.answer("Acceso denegado", show_alert=True)
+        return
+    # El UPDATE masivo corre aparte: no retiene el worker de updates de este usuario
+    await callback.message.edit_text("⏳ Ajustando niveles...")
+    await callback.answer()
+    run_in_background(_reconcile_levels(callback.message), "reconcile_levels")
+
+
+async def _reconcile_levels(message: Message):
+    Session = await get_session()
+    try:
+        async with Session() as session:
+            changed = await LevelService(session).reconcile_levels()
+        await message.edit_text(
+            f"✅ Niveles ajustados: {changed} usuarios actualizados.",
+            reply_markup=get_admin_content_levels_keyboard(),
+        )
+    except Exception as e:
+        logger.error(f"Error reconciling levels: {e}")
+        await message.edit_text(f"❌ Error al ajustar los niveles: {e}", reply_markup=get_admin_content_levels_keyboard())
+
+
 @router.callback_query(F.data == "admin_edit_reward")
 async def admin_edit_reward(callback: CallbackQuery):
     if callback.from_user.id != Config.ADMIN_ID:
@@ -575,6 +615,25 @@ async def admin_manage_events_sorteos(callback: CallbackQuery):
 
 
 
+@router.callback_query(F.data == "admin_channel_post_stats")
+async def admin_channel_post_stats(callback: CallbackQuery, session: AsyncSession):
+    if callback.from_user.id != Config.ADMIN_ID:
+        await callback.answer("Acceso denegado", show_alert=True)
+        return
+    posts = await PostStatsService(session).get_recent_posts(limit=10)
+    if not posts:
+        text = "📊 Aún no hay publicaciones con reacciones en el canal."
+    else:
+        lines = ["📊 *Reacciones de las últimas publicaciones*\n"]
+        for post in posts:
+            total = post.likes + post.dislikes
+            approval = f"{post.likes * 100 // total}%" if total else "-"
+            lines.append(f"ID `{post.message_id}`: 👍 {post.likes} | 👎 {post.dislikes} | Total {total} | Aprobación {approval}")
+        text = "\n".join(lines)
+    await callback.message.edit_text(text, reply_markup=get_admin_main_keyboard(), parse_mode="Markdown")
+    await callback.answer()
+
+
 @router.callback_query(F.data == "admin_bot_config")
 async def admin_bot_config(callback: CallbackQuery):
     if callback.from_user.id != Config.ADMIN_ID:
@@ -720,48 +779,42 @@ async def admin_process_mission_requires_action(message: Message, state: FSMCont
 
 
 @router.callback_query(F.data == "admin_export_data")
-async def admin_export_data(callback: CallbackQuery, session: AsyncSession):
+async def admin_export_data(callback: CallbackQuery):
+    if callback.from_user.id != Config.ADMIN_ID: return
+    await callback.message.edit_text(
+        "📤 *Exportar usuarios* - Elige el formato:",
+        reply_markup=get_export_format_keyboard(available_export_formats()),
+        parse_mode="Markdown",
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("admin_export_data:"))
+async def admin_export_data_format(callback: CallbackQuery):
     if callback.from_user.id != Config.ADMIN_ID: return
+    fmt = callback.data.split(":")[1]
+    await callback.answer("Generando exportación...")
+    # La exportación puede tardar minutos: corre aparte para no retener el worker de updates de este usuario
+    run_in_background(_export_users(callback.message, fmt), f"export_users:{fmt}")
 
-    try:
-        users_stmt = select(User)
-        users_result = await session.execute(users_stmt)
-        users = users_result.scalars().all()
 
-        if not users:
-            await callback.answer("No hay datos de usuarios para exportar.", show_alert=True)
+async def _export_users(message: Message, fmt: str):
+    Session = await get_session()
+    path = None
+    try:
+        # Se escribe por lotes en un archivo temporal: la memoria no depende del número de usuarios
+        async with Session() as session:
+            path, filename, rows = await ExportService(session).export_users(fmt)
+        if rows == 0:
+            await message.answer("No hay datos de usuarios para exportar.")
             return
-
-        output = io.StringIO()
-        writer = csv.writer(output)
-
-        # Encabezados
-        writer.writerow(['ID', 'Username', 'First Name', 'Last Name', 'Points', 'Level', 'Achievements', 'Missions Completed', 'Last Daily Mission Reset', 'Last Weekly Mission Reset', 'Channel Reactions', 'Created At', 'Updated At'])
-
-        # Datos de usuarios
-        for user in users:
-            writer.writerow([
-                user.id,
-                user.username,
-                user.first_name,
-                user.last_name,
-                user.points,
-                user.level,
-                json.dumps(user.achievements), # Convertir dict a string JSON
-                json.dumps(user.missions_completed), # Convertir dict a string JSON
-                user.last_daily_mission_reset.isoformat() if user.last_daily_mission_reset else '',
-                user.last_weekly_mission_reset.isoformat() if user.last_weekly_mission_reset else '',
-                json.dumps(user.channel_reactions) if user.channel_reactions else '{}', # Nuevo campo
-                user.created_at.isoformat() if user.created_at else '',
-                user.updated_at.isoformat() if user.updated_at else ''
-            ])
-
-        output.seek(0)
-        await callback.message.answer_document(InputFile(io.BytesIO(output.getvalue().encode('utf-8')), filename="users_data.csv"))
-        await callback.answer("Datos exportados exitosamente.", show_alert=True)
+        await message.answer_document(FSInputFile(path, filename=filename), caption=f"{rows} usuarios exportados.")
     except Exception as e:
         logger.error(f"Error exporting data: {e}")
-        await callback.answer(f"Error al exportar datos: {e}", show_alert=True)
+        await message.answer(f"Error al exportar datos: {e}")
+    finally:
+        if path and os.path.exists(path):
+            os.remove(path)
 
 
 @router.callback_query(F.data == "admin_reset_season")
@@ -778,10 +831,12 @@ async def admin_confirm_reset_season(callback: CallbackQuery):
 async def admin_perform_reset_season(callback: CallbackQuery, session: AsyncSession):
     if callback.from_user.id != Config.ADMIN_ID: return
     try:
-        stmt = update(User).values(points=0, level=1, achievements={}, missions_completed={}, channel_reactions={}) # Reset channel_reactions too
-        await session.execute(stmt)
-        await session.commit()
-        await callback.message.edit_text("✅ ¡Temporada reseteada exitosamente! Todos los puntos, niveles, logros y misiones completadas han sido reiniciados.")
+        # Archiva y resetea por lotes en segundo plano; este mensaje se edita con el progreso
+        season = await season_rollover.start(session, callback.message.chat.id, callback.message.message_id)
+        if season is None:
+            await callback.answer("Ya hay un reseteo de temporada en curso.", show_alert=True)
+            return
+        await callback.message.edit_text(f"⏳ Reseteando temporada... 0/{season.total} usuarios archivados y reiniciados.")
         await callback.answer()
     except Exception as e:
         await callback.message.edit_text(f"❌ Error al resetear la temporada: {e}")
@@ -835,7 +890,7 @@ async def admin_process_assign_points_amount(message: Message, state: FSMContext
         if user_identifier.isdigit(): # Try to find by ID
             user = await session.get(User, int(user_identifier))
         elif user_identifier.startswith('@'): # Try to find by username
-            stmt = select(User).where(User.username == user_identifier[1:])
+            stmt = select(User).where(func.lower(User.username) == user_identifier[1:].lower()) # Usa ix_users_username_lower
             result = await session.execute(stmt)
             user = result.scalar_one_or_none()
 
@@ -929,6 +984,9 @@ async def admin_process_event_duration(message: Message, state: FSMContext, sess
         session.add(new_event)
         await session.commit()
         await session.refresh(new_event)
+        active_events.invalidate() # El multiplicador se aplica desde la siguiente puntuación
+        if new_event.end_time:
+            event_lifecycle.schedule_expiry(new_event.id, new_event.end_time)
 
         # Notificar a los usuarios en el canal principal sobre el evento
         event_message = (
@@ -968,7 +1026,7 @@ async def admin_start_channel_post_reactions(callback: CallbackQuery, state: FSM
     await callback.answer()
 
 @router.message(AdminStates.waiting_for_channel_post_text)
-async def admin_process_channel_post_text(message: Message, state: FSMContext, bot: Bot):
+async def admin_process_channel_post_text(message: Message, state: FSMContext, bot: Bot, session: AsyncSession):
     if message.from_user.id != Config.ADMIN_ID: return
     
     post_text = message.text
@@ -993,6 +1051,8 @@ async def admin_process_channel_post_text(message: Message, state: FSMContext, b
             message_id=real_message_id,
             reply_markup=updated_keyboard
         )
+        # Contadores de reacciones de la publicación (los botones muestran los totales en vivo)
+        await PostStatsService(session).register_post(real_message_id, Config.CHANNEL_ID)
 
         await message.answer(
             f"✅ Mensaje publicado en el canal (ID: `{real_message_id}`) con botones de reacción. "
@@ -7,10 +7,11 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from database.models import User, Mission, Reward, get_user_menu_state, set_user_menu_state
 from services.point_service import PointService
-from services.level_service import LevelService
-from services.achievement_service import AchievementService, ACHIEVEMENTS
 from services.mission_service import MissionService
 from services.reward_service import RewardService
+from services.unit_of_work import UnitOfWork
+from services.leaderboard_service import leaderboard
+from services.reaction_pipeline import reaction_pipeline
 from utils.keyboard_utils import (
     get_main_menu_keyboard, get_profile_keyboard, get_missions_keyboard,
     get_reward_keyboard, get_confirm_purchase_keyboard, get_ranking_keyboard,
@@ -18,7 +19,7 @@ from utils.keyboard_utils import (
     get_root_menu, get_parent_menu, get_child_menu,  # <--- Estas fueron añadidas/confirmadas
     get_main_reply_keyboard  # <--- Asegúrate de que esta esté aquí también
 )
-from utils.message_utils import get_profile_message, get_mission_details_message, get_reward_details_message, get_ranking_message # Añadido get_ranking_message
+from utils.message_utils import get_cached_profile_message, get_mission_details_message, get_reward_details_message, get_ranking_message # Añadido get_ranking_message
 from utils.messages import BOT_MESSAGES # <--- Asegúrate de que esta esté importada
 
 from config import Config
@@ -29,6 +30,25 @@ logger = logging.getLogger(__name__)
 
 router = Router()
 
+RANKING_PAGE_SIZE = 10
+
+
+async def _build_ranking_page(session: AsyncSession, cursor: tuple[int, int] | None = None, start_rank: int = 1) -> tuple[str, InlineKeyboardMarkup]:
+    """
+    Renders one keyset page of the ranking.
+    cursor is the (points, user_id) of the last row of the previous page and start_rank the rank that follows it.
+    """
+    point_service = PointService(session)
+    start_rank, users = await point_service.get_leaderboard_page(cursor, limit=RANKING_PAGE_SIZE, start_rank=start_rank)
+    if cursor is not None and not users:
+        return BOT_MESSAGES["ranking_end_reached"], get_ranking_keyboard(show_first_page=True)
+
+    message_text = await get_ranking_message(users, start_rank=start_rank)
+    next_cursor = None
+    if len(users) == RANKING_PAGE_SIZE:
+        next_cursor = (users[-1].points, users[-1].id, start_rank + len(users))
+    return message_text, get_ranking_keyboard(next_cursor=next_cursor, show_first_page=cursor is not None)
+
 
 async def _handle_start_flow(message: Message, session: AsyncSession, bot: Bot) -> None:
     """Common logic for /start handling once user is identified."""
@@ -50,6 +70,7 @@ async def _handle_start_flow(message: Message, session: AsyncSession, bot: Bot)
             level=1,
         )
         session.add(new_user)
+        leaderboard.stage(session, new_user)
         await session.commit()
         await session.refresh(new_user)
         user = new_user
@@ -116,14 +137,8 @@ async def menu_callback_handler(callback: CallbackQuery, session: AsyncSession):
     message_text = ""
 
     if menu_type == "profile":
-        user = await session.get(User, user_id)
-        point_service = PointService(session)
-        level_service = LevelService(session)
-        achievement_service = AchievementService(session)
-        mission_service = MissionService(session)
-        active_missions = await mission_service.get_active_missions(user_id=user_id) # Pasa el user_id para filtrar misiones
-        
-        message_text = await get_profile_message(user, active_missions)
+        # Perfil en caché mientras no cambien sus puntos, logros o misiones: sin consultas
+        message_text = await get_cached_profile_message(session, user_id) or BOT_MESSAGES["profile_not_registered"]
         keyboard = get_profile_keyboard()
         new_state = "profile"
     elif menu_type == "missions":
@@ -139,10 +154,7 @@ async def menu_callback_handler(callback: CallbackQuery, session: AsyncSession):
         keyboard = get_reward_keyboard(active_rewards)
         new_state = "rewards"
     elif menu_type == "ranking":
-        point_service = PointService(session)
-        top_users = await point_service.get_top_users(limit=10) # Asegúrate de que get_top_users exista
-        message_text = await get_ranking_message(top_users) # Asegúrate de que get_ranking_message exista
-        keyboard = get_ranking_keyboard()
+        message_text, keyboard = await _build_ranking_page(session) # Primera página del ranking
         new_state = "ranking"
     elif menu_type == "back":
         # Lógica de "volver"
@@ -166,6 +178,34 @@ async def menu_callback_handler(callback: CallbackQuery, session: AsyncSession):
     await callback.answer()
 
 
+# Handler para las páginas siguientes del ranking (paginación por keyset, sin OFFSET)
+@router.callback_query(F.data.startswith("ranking_page:"))
+async def handle_ranking_page_callback(callback: CallbackQuery, session: AsyncSession):
+    _, points, user_id, start_rank = callback.data.split(':')
+    message_text, keyboard = await _build_ranking_page(session, cursor=(int(points), int(user_id)), start_rank=int(start_rank))
+    await callback.message.edit_text(message_text, reply_markup=keyboard)
+    await callback.answer()
+
+
+# Handler para "Mi posición": el usuario y sus vecinos en el ranking
+@router.callback_query(F.data == "ranking_me")
+async def handle_ranking_me_callback(callback: CallbackQuery, session: AsyncSession):
+    user_id = callback.from_user.id
+    point_service = PointService(session)
+    rank, start_rank, neighbors = await point_service.get_user_rank(user_id)
+    if rank is None:
+        await callback.answer(BOT_MESSAGES["ranking_not_ranked"], show_alert=True)
+        return
+
+    message_text = await get_ranking_message(
+        neighbors,
+        start_rank=start_rank,
+        title=BOT_MESSAGES["ranking_my_position_title"].format(rank=rank),
+    )
+    await callback.message.edit_text(message_text, reply_markup=get_ranking_keyboard(show_first_page=True))
+    await callback.answer()
+
+
 # Handler para comprar una recompensa
 @router.callback_query(F.data.startswith("buy_reward_"))
 async def handle_buy_reward_callback(callback: CallbackQuery, session: AsyncSession):
@@ -259,43 +299,43 @@ async def handle_complete_mission_callback(callback: CallbackQuery, session: Asy
     user_id = callback.from_user.id
     mission_id = callback.data[len("complete_mission_"):]
 
-    mission_service = MissionService(session)
-    point_service = PointService(session)
-    level_service = LevelService(session)
-    achievement_service = AchievementService(session)
+    # Todos los cambios (misión, puntos, nivel, logro) se confirman en un único commit al salir del bloque
+    async with UnitOfWork(session) as uow:
+        user = await session.get(User, user_id)
+        mission = await uow.missions.get_mission_by_id(mission_id)
 
-    user = await session.get(User, user_id)
-    mission = await mission_service.get_mission_by_id(mission_id)
+        if not user or not mission:
+            await callback.answer("Error: Usuario o misión no encontrada.", show_alert=True)
+            return
 
-    if not user or not mission:
-        await callback.answer("Error: Usuario o misión no encontrada.", show_alert=True)
-        return
+        # Verificar si la misión ya está completada para el período actual
+        is_completed_for_period, _ = await uow.missions.check_mission_completion_status(user, mission)
+        if is_completed_for_period:
+            await callback.answer("Ya completaste esta misión. ¡Pronto habrá más!", show_alert=True)
+            return
 
-    # Verificar si la misión ya está completada para el período actual
-    is_completed_for_period, _ = await mission_service.check_mission_completion_status(user, mission)
-    if is_completed_for_period:
-        await callback.answer("Ya completaste esta misión. ¡Pronto habrá más!", show_alert=True)
-        return
+        is_first_mission = not await uow.missions.has_completed_any(user_id) # Se evalúa antes de registrar la misión
 
-    # Intentar completar la misión
-    completed, completed_mission_obj = await mission_service.complete_mission(user_id, mission_id)
+        # Intentar completar la misión (complete_mission ya suma los puntos de recompensa)
+        completed, completed_mission_obj, points_awarded = await uow.missions.complete_mission(user_id, mission_id)
+
+        leveled_up = False
+        if completed:
+            leveled_up = await uow.levels.check_for_level_up(user)
+
+            # Opcional: Otorgar un logro por la primera misión
+            if is_first_mission:
+                await uow.achievements.grant_achievement(user_id, "first_mission")
 
     if completed:
-        updated_user = await point_service.add_points(user_id, completed_mission_obj.points_reward)
-        leveled_up = await level_service.check_for_level_up(updated_user)
-        
-        # Opcional: Otorgar un logro por la primera misión
-        if not user.missions_completed: # Si es la primera misión del usuario
-             await achievement_service.grant_achievement(user_id, "first_mission")
-
-        alert_message = f"🎉 ¡Misión '{completed_mission_obj.name}' completada! Ganaste `{completed_mission_obj.points_reward}` puntos."
+        alert_message = f"🎉 ¡Misión '{completed_mission_obj.name}' completada! Ganaste `{points_awarded}` puntos."
         if leveled_up:
-            alert_message += f"\n\n✨ ¡Felicidades! Has subido al nivel `{updated_user.level}`."
+            alert_message += f"\n\n✨ ¡Felicidades! Has subido al nivel `{user.level}`."
 
         await callback.answer(alert_message, show_alert=True)
 
         # Volver al menú de misiones y actualizarlo
-        active_missions = await mission_service.get_active_missions(user_id=user_id) # Volver a obtener las misiones activas
+        active_missions = await MissionService(session).get_active_missions(user_id=user_id) # Volver a obtener las misiones activas
         await callback.message.edit_text(
             BOT_MESSAGES["menu_missions_text"],
             reply_markup=get_missions_keyboard(active_missions)
@@ -314,67 +354,21 @@ async def handle_reaction_callback(callback: CallbackQuery, session: AsyncSessio
     reaction_type = parts[1] # 'like' or 'dislike'
     target_message_id = int(parts[2]) # ID del mensaje al que se reaccionó
 
-    # Asume un servicio para manejar reacciones y puntos
-    # Puedes crear un ReactionService o integrar esto en PointService/MissionService
-    point_service = PointService(session)
-    mission_service = MissionService(session)
-    level_service = LevelService(session)
-    achievement_service = AchievementService(session)
-
-    # Puntos base por reacción
-    base_points_for_reaction = 10 if reaction_type == "like" else 5 # Ejemplo
-
-    user = await session.get(User, user_id)
-    if not user:
+    if not await session.get(User, user_id):
         await callback.answer("Por favor, inicia con /start antes de reaccionar.", show_alert=True)
         return
 
-    # Verificar si el usuario ya reaccionó a este mensaje para evitar spam de puntos
-    if user.channel_reactions and user.channel_reactions.get(str(target_message_id)):
+    # Se guarda la reacción antes de confirmarla; puntos, misiones y nivel se suman por lotes en el pipeline
+    if not await reaction_pipeline.record(session, user_id, target_message_id, reaction_type):
         await callback.answer("Ya has reaccionado a este mensaje.", show_alert=True)
         return
+    await session.commit()
+    reaction_pipeline.notify()
 
-    # Añadir los puntos base
-    updated_user = await point_service.add_points(user_id, base_points_for_reaction)
-    leveled_up = await level_service.check_for_level_up(updated_user) # Verificar si sube de nivel
-
-    # Marcar el mensaje como reaccionado por el usuario
-    if user.channel_reactions is None:
-        user.channel_reactions = {}
-    user.channel_reactions[str(target_message_id)] = True  # Puedes guardar el timestamp si quieres más detalle
-    await session.commit() # Guardar el estado de reacción
-
-    # Verificar si hay misiones relacionadas con la reacción
-    mission_completed_message = ""
-    # Obtener misiones activas que requieran acción
-    active_action_missions = await mission_service.get_active_missions(user_id=user_id, mission_type="reaction") # Asume un tipo 'reaction'
-    
-    for mission in active_action_missions:
-        # Aquí la action_data de la misión debería especificar el message_id y/o reaction_type
-        # Ejemplo: mission.action_data = {'target_message_id': X, 'reaction_type': 'like'}
-        requires_specific_message = mission.action_data and mission.action_data.get('target_message_id') == target_message_id
-        requires_specific_reaction = mission.action_data and mission.action_data.get('reaction_type') == reaction_type
-
-        # Si la misión no requiere una acción específica o si la requiere y coincide
-        if mission.requires_action and (not mission.action_data or (requires_specific_message and requires_specific_reaction)):
-            # Check if the user has already completed this mission for the current period
-            is_completed_for_period, _ = await mission_service.check_mission_completion_status(user, mission, target_message_id=target_message_id) # Pasa target_message_id
-            
-            if not is_completed_for_period:
-                completed, mission_obj = await mission_service.complete_mission(user_id, mission.id, target_message_id=target_message_id)
-                if completed:
-                    mission_completed_message = f"\n\n🎉 ¡Misión completada: **{mission_obj.name}**! Ganaste `{mission_obj.points_reward}` puntos adicionales."
-                    updated_user = await point_service.add_points(user_id, mission_obj.points_reward)
-                    leveled_up = await level_service.check_for_level_up(updated_user) or leveled_up # Check level up again after mission points
-
-    alert_message = f"¡Reacción registrada! Ganaste `{base_points_for_reaction}` puntos."
-    alert_message += mission_completed_message
-
-    if leveled_up:
-        alert_message += f"\n\n✨ ¡Felicidades! Has subido al nivel `{updated_user.level}`."
-
-    await callback.answer(alert_message, show_alert=True)
-    logger.info(f"User {user_id} reacted with {reaction_type} to message {target_message_id}. Points awarded.")
+    # Los puntos los calcula el pipeline al procesar el lote (con el multiplicador vigente entonces):
+    # aquí no se muestra una cifra que podría no coincidir. Misiones y subidas de nivel se notifican por mensaje
+    await callback.answer("¡Reacción registrada! Tus puntos se sumarán en unos segundos.", show_alert=True)
+    logger.info(f"User {user_id} reacted with {reaction_type} to message {target_message_id}. Stored, points queued.")
 
 # --- Handlers para los botones del ReplyKeyboardMarkup ---
 # Estos handlers se activarán cuando el usuario envíe el texto exacto del botón.
@@ -382,14 +376,8 @@ async def handle_reaction_callback(callback: CallbackQuery, session: AsyncSessio
 @router.message(F.text == "👤 Perfil")
 async def show_profile_from_reply_keyboard(message: Message, session: AsyncSession):
     user_id = message.from_user.id
-    user = await session.get(User, user_id)
-    if user:
-        point_service = PointService(session)
-        level_service = LevelService(session)
-        achievement_service = AchievementService(session)
-        mission_service = MissionService(session)
-        active_missions = await mission_service.get_active_missions(user_id=user_id)
-        profile_message = await get_profile_message(user, active_missions)
+    profile_message = await get_cached_profile_message(session, user_id)
+    if profile_message:
         await set_user_menu_state(session, user_id, "profile")
         # Mostrar el perfil con su teclado INLINE específico (para Volver y Menú Principal)
         await message.answer(profile_message, reply_markup=get_profile_keyboard())
@@ -415,11 +403,9 @@ async def show_rewards_from_reply_keyboard(message: Message, session: AsyncSessi
 @router.message(F.text == "🏆 Ranking")
 async def show_ranking_from_reply_keyboard(message: Message, session: AsyncSession):
     user_id = message.from_user.id
-    point_service = PointService(session)
-    top_users = await point_service.get_top_users(limit=10)
-    ranking_message = await get_ranking_message(top_users)
+    ranking_message, keyboard = await _build_ranking_page(session)
     await set_user_menu_state(session, user_id, "ranking")
-    await message.answer(ranking_message, reply_markup=get_ranking_keyboard())
+    await message.answer(ranking_message, reply_markup=keyboard)
 
 # IMPORTANTE: Este handler debe ir AL FINAL de todos los otros F.text handlers,
 # porque si no, podría capturar otros mensajes antes de que sean procesados por handlers más específicos.
@@ -0,0 +1,105 @@
+# middlewares/user_lock.py
+import asyncio
+import time
+import logging
+from typing import Any, Awaitable, Callable
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+logger = logging.getLogger(__name__)
+
+
+class UserLockStats:
+    """Lock wait times and queue depth, accumulated between reports."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.acquired = 0
+        self.contended = 0 # Updates que tuvieron que esperar a otro del mismo usuario
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.max_depth = 0 # Mayor número de updates de un mismo usuario en vuelo a la vez
+
+    def record(self, wait: float, depth: int):
+        self.acquired += 1
+        if depth > 1:
+            self.contended += 1
+        self.total_wait += wait
+        if wait > self.max_wait:
+            self.max_wait = wait
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+
+class _UserSlot:
+    __slots__ = ("lock", "depth")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.depth = 0 # Updates de este usuario procesándose o esperando
+
+
+class UserLockMiddleware(BaseMiddleware):
+    """
+    Serializes updates per user: a second update from the same user (e.g. a double tap on a
+    reaction button) waits until the first one, including its commit, has finished. Updates
+    of different users never wait for each other. Locks exist only while a user has updates
+    in flight, so memory does not grow with the number of users.
+
+    Register it on dp.update so it wraps the session middleware. The lock is per process;
+    the primary keys on the progress tables still guard against duplicates across workers.
+    """
+
+    def __init__(self):
+        self._slots: dict[int, _UserSlot] = {}
+        self.stats = UserLockStats()
+
+    @property
+    def in_flight(self) -> int:
+        """Updates currently being processed or waiting, across all users."""
+        return sum(slot.depth for slot in self._slots.values())
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        slot = self._slots.get(user.id)
+        if slot is None:
+            slot = self._slots[user.id] = _UserSlot()
+        slot.depth += 1
+        depth = slot.depth # Incluye a este update: >1 significa que tendrá que esperar
+        started = time.perf_counter()
+        try:
+            async with slot.lock:
+                self.stats.record(time.perf_counter() - started, depth)
+                return await handler(event, data)
+        finally:
+            slot.depth -= 1
+            if slot.depth == 0:
+                del self._slots[user.id]
+
+    def get_status(self) -> dict:
+        """
+        Returns the statistics collected since the last call plus the current queue depth.
+        Statistics are reset on every call so each report covers one interval.
+        """
+        stats = self.stats
+        status = {
+            "acquired": stats.acquired,
+            "contended": stats.contended,
+            "avg_wait_ms": stats.total_wait / stats.acquired * 1000 if stats.acquired else 0.0,
+            "max_wait_ms": stats.max_wait * 1000,
+            "max_depth": stats.max_depth,
+            "in_flight": self.in_flight,
+            "users": len(self._slots),
+        }
+        stats.reset()
+        return status
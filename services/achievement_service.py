@@ -1,5 +1,7 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from database.models import User
+from sqlalchemy import select
+from database.models import User, UserAchievement
+from services.profile_cache import profile_cache
 import datetime
 
 # Definición de logros (ejemplo)
@@ -13,30 +15,41 @@ ACHIEVEMENTS = {
 }
 
 class AchievementService:
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session: AsyncSession, autocommit: bool = True):
         self.session = session
+        self.autocommit = autocommit
 
     async def grant_achievement(self, user_id: int, achievement_id: str) -> bool:
         user = await self.session.get(User, user_id)
         if not user:
             return False
 
-        if achievement_id not in user.achievements:
-            user.achievements[achievement_id] = datetime.datetime.now().isoformat()
-            await self.session.commit()
-            await self.session.refresh(user)
+        # Primary key lookup on (user_id, achievement_id)
+        if await self.session.get(UserAchievement, (user_id, achievement_id)) is None:
+            self.session.add(UserAchievement(
+                user_id=user_id,
+                achievement_id=achievement_id,
+                granted_at=datetime.datetime.now(),
+            ))
+            profile_cache.stage(self.session, user_id)
+            if self.autocommit:
+                await self.session.commit()
             return True
         return False
 
     async def get_user_achievements(self, user_id: int) -> dict:
-        user = await self.session.get(User, user_id)
-        if not user:
-            return {}
+        """Returns {achievement_id: {name, icon, granted_at}} ordered by grant date."""
+        stmt = (
+            select(UserAchievement.achievement_id, UserAchievement.granted_at)
+            .where(UserAchievement.user_id == user_id)
+            .order_by(UserAchievement.granted_at)
+        )
+        result = await self.session.execute(stmt)
         granted_achievements = {}
-        for ach_id, timestamp_str in user.achievements.items():
+        for ach_id, granted_at in result.all():
             if ach_id in ACHIEVEMENTS:
                 # Create a mutable copy of the achievement data
                 ach_data = ACHIEVEMENTS[ach_id].copy()
-                ach_data['granted_at'] = timestamp_str # Store as ISO format string
+                ach_data['granted_at'] = granted_at # datetime
                 granted_achievements[ach_id] = ach_data
         return granted_achievements
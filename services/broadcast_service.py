@@ -0,0 +1,307 @@
+# services/broadcast_service.py
+import asyncio
+import datetime
+import time
+import logging
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+from sqlalchemy import select, update, func, or_
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from database.models import User, Broadcast
+from services.job_lease import JobLease, WORKER_ID
+from utils.keyboard_utils import get_broadcast_progress_keyboard
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Reintentos por destinatario cuando Telegram responde 429 (flood wait)
+MAX_RETRY_AFTER_ATTEMPTS = 3
+
+
+class TokenBucket:
+    """
+    Async token bucket shared by every broadcast, so all of them together stay under the bot's
+    global send limit. pause() empties the bucket and blocks every sender until a flood wait ends.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock: # Los que esperan se atienden en orden de llegada
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+# Límite global de envío del bot, compartido por las difusiones y otras notificaciones masivas
+send_limiter = TokenBucket(Config.BROADCAST_RATE_PER_SECOND)
+
+
+class BroadcastEngine:
+    """
+    Sends a text to every user in the background, without blocking the admin's update.
+
+    Recipients are read in chunks of Config.BROADCAST_CHUNK_SIZE ordered by User.id, sent through
+    a shared token bucket with at most Config.BROADCAST_CONCURRENCY messages in flight, and the
+    last processed id is persisted after each chunk. A broadcast interrupted by a restart resumes
+    from that checkpoint (at most one chunk is sent twice). Progress and throughput are reported
+    by editing the admin's progress message.
+
+    With several workers each broadcast is sent by the one holding its lease (JobLease);
+    resume_pending() runs at startup and periodically, and only launches what it can claim.
+    Cancelling marks the row, so the owner stops even when the admin's tap reached another worker.
+    """
+
+    def __init__(self):
+        self._session_factory: async_sessionmaker[AsyncSession] = None
+        self._bot: Bot = None
+        self._bucket = send_limiter
+        self._tasks: dict[int, asyncio.Task] = {}
+        self._cancel_requested: set[int] = set()
+
+    def configure(self, session_factory: async_sessionmaker[AsyncSession], bot: Bot):
+        self._session_factory = session_factory
+        self._bot = bot
+
+    async def start(self, session: AsyncSession, admin_chat_id: int, text: str, progress_message_id: int = None) -> Broadcast:
+        """Creates the broadcast record and launches it in the background."""
+        total = await session.scalar(select(func.count(User.id)))
+        broadcast = Broadcast(
+            text=text,
+            status="running",
+            admin_chat_id=admin_chat_id,
+            progress_message_id=progress_message_id,
+            last_user_id=0,
+            total=total or 0,
+            sent=0,
+            failed=0,
+        )
+        session.add(broadcast)
+        await session.commit()
+        self._launch(broadcast.id)
+        return broadcast
+
+    async def resume_pending(self) -> int:
+        """
+        Tries to take over the running broadcasts that no live worker owns (left by a previous
+        process or a crashed worker). Returns how many were launched here.
+        """
+        stale = datetime.datetime.now() - datetime.timedelta(seconds=Config.JOB_LEASE_SECONDS)
+        async with self._session_factory() as session:
+            result = await session.execute(
+                select(Broadcast.id).where(
+                    Broadcast.status == "running",
+                    or_(Broadcast.owner.is_(None), Broadcast.heartbeat < stale),
+                )
+            )
+            broadcast_ids = [broadcast_id for broadcast_id in result.scalars().all() if broadcast_id not in self._tasks]
+        for broadcast_id in broadcast_ids:
+            self._launch(broadcast_id) # _run solo continúa si consigue la reserva
+        return len(broadcast_ids)
+
+    async def cancel(self, session: AsyncSession, broadcast_id: int) -> bool:
+        """
+        Marks a running broadcast as cancelled. The owner stops at its next checkpoint or lease
+        renewal; if it runs in this process it stops right away. Returns False if it was not running.
+        """
+        cancelled = await session.scalar(
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id, Broadcast.status == "running")
+            .values(status="cancelled", finished_at=datetime.datetime.now())
+            .returning(Broadcast.id)
+        )
+        await session.commit()
+        if cancelled is None:
+            return False
+        await self._stop_local(broadcast_id, cancelled=True)
+        return True
+
+    async def _stop_local(self, broadcast_id: int, cancelled: bool):
+        task = self._tasks.get(broadcast_id)
+        if task is None:
+            return
+        if cancelled:
+            self._cancel_requested.add(broadcast_id)
+        task.cancel()
+
+    async def _get_status(self, broadcast_id: int) -> str | None:
+        async with self._session_factory() as session:
+            return await session.scalar(select(Broadcast.status).where(Broadcast.id == broadcast_id))
+
+    async def _on_lease_lost(self, broadcast_id: int):
+        # La reserva no se pudo renovar: cancelada desde otro proceso o retomada por otro worker
+        status = await self._get_status(broadcast_id)
+        if status != "cancelled":
+            logger.warning(f"Broadcast {broadcast_id} was taken over by another worker; stopping here.")
+        await self._stop_local(broadcast_id, cancelled=status == "cancelled")
+
+    def _launch(self, broadcast_id: int):
+        if self._session_factory is None or self._bot is None:
+            raise RuntimeError("Broadcast engine not configured. Call broadcast_engine.configure() first.")
+        if broadcast_id in self._tasks:
+            return
+        task = asyncio.create_task(self._run(broadcast_id))
+        self._tasks[broadcast_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
+
+    async def _run(self, broadcast_id: int):
+        lease = JobLease(self._session_factory, Broadcast, broadcast_id)
+        if not await lease.acquire():
+            return # Terminada, cancelada o en manos de otro worker
+        lease.keep_alive(lambda: self._on_lease_lost(broadcast_id))
+        try:
+            await self._send_all(broadcast_id)
+        finally:
+            await lease.release()
+
+    async def _send_all(self, broadcast_id: int):
+        async with self._session_factory() as session:
+            broadcast = await session.get(Broadcast, broadcast_id)
+        if broadcast is None or broadcast.status != "running":
+            return
+        if broadcast.last_user_id:
+            logger.info(f"Resuming broadcast {broadcast_id} from user {broadcast.last_user_id}.")
+
+        semaphore = asyncio.Semaphore(Config.BROADCAST_CONCURRENCY)
+        started = time.monotonic()
+        sent_at_start = broadcast.sent + broadcast.failed # Para medir el ritmo solo de esta ejecución
+        last_report = 0.0
+        try:
+            while True:
+                async with self._session_factory() as session:
+                    result = await session.execute(
+                        select(User.id)
+                        .where(User.id > broadcast.last_user_id)
+                        .order_by(User.id)
+                        .limit(Config.BROADCAST_CHUNK_SIZE)
+                    )
+                    user_ids = result.scalars().all()
+                if not user_ids:
+                    break
+
+                outcomes = await asyncio.gather(*(self._send(semaphore, user_id, broadcast.text) for user_id in user_ids))
+                sent = sum(outcomes)
+                if not await self._checkpoint(broadcast, user_ids[-1], sent, len(outcomes) - sent):
+                    # Cancelada desde otro proceso o retomada por otro worker
+                    if await self._get_status(broadcast_id) == "cancelled":
+                        await self._finish(broadcast, "cancelled")
+                        logger.info(f"Broadcast {broadcast_id} cancelled by the admin.")
+                    return
+
+                now = time.monotonic()
+                if now - last_report >= Config.BROADCAST_PROGRESS_INTERVAL_SECONDS:
+                    last_report = now
+                    await self._report(broadcast, self._rate(broadcast, sent_at_start, started))
+
+            await self._finish(broadcast, "done")
+            logger.info(f"Broadcast {broadcast_id} finished: {broadcast.sent} sent, {broadcast.failed} failed.")
+        except asyncio.CancelledError:
+            if broadcast_id in self._cancel_requested:
+                self._cancel_requested.discard(broadcast_id)
+                await self._finish(broadcast, "cancelled")
+                logger.info(f"Broadcast {broadcast_id} cancelled by the admin.")
+                return
+            # Apagado del bot: queda en 'running' y se reanuda desde el último punto de control
+            raise
+        except Exception as e:
+            logger.error(f"Broadcast {broadcast_id} stopped at user {broadcast.last_user_id}: {e}")
+
+    async def _send(self, semaphore: asyncio.Semaphore, user_id: int, text: str) -> bool:
+        async with semaphore:
+            for _ in range(MAX_RETRY_AFTER_ATTEMPTS):
+                await self._bucket.acquire()
+                try:
+                    await self._bot.send_message(user_id, text)
+                    return True
+                except TelegramRetryAfter as e:
+                    logger.warning(f"Flood wait of {e.retry_after}s while broadcasting; pausing all sends.")
+                    self._bucket.pause(e.retry_after)
+                except TelegramForbiddenError:
+                    return False # El usuario bloqueó el bot
+                except Exception as e:
+                    logger.warning(f"No se pudo enviar notificación a {user_id}: {e}")
+                    return False
+            return False
+
+    async def _checkpoint(self, broadcast: Broadcast, last_user_id: int, sent: int, failed: int) -> bool:
+        """Persists progress while this worker still owns the running broadcast. Returns False otherwise."""
+        broadcast.last_user_id = last_user_id
+        broadcast.sent += sent
+        broadcast.failed += failed
+        async with self._session_factory() as session:
+            saved = await session.scalar(
+                update(Broadcast)
+                .where(Broadcast.id == broadcast.id, Broadcast.owner == WORKER_ID, Broadcast.status == "running")
+                .values(last_user_id=last_user_id, sent=broadcast.sent, failed=broadcast.failed)
+                .returning(Broadcast.id)
+            )
+            await session.commit()
+        return saved is not None
+
+    async def _finish(self, broadcast: Broadcast, status: str):
+        broadcast.status = status
+        async with self._session_factory() as session:
+            await session.execute(
+                update(Broadcast)
+                .where(Broadcast.id == broadcast.id, Broadcast.owner == WORKER_ID)
+                .values(status=status, finished_at=datetime.datetime.now())
+            )
+            await session.commit()
+        await self._report(broadcast)
+
+    @staticmethod
+    def _rate(broadcast: Broadcast, processed_at_start: int, started: float) -> float:
+        elapsed = time.monotonic() - started
+        return (broadcast.sent + broadcast.failed - processed_at_start) / elapsed if elapsed > 0 else 0.0
+
+    async def _report(self, broadcast: Broadcast, rate: float = None):
+        """Edits the admin's progress message. Reporting failures never stop the broadcast."""
+        if not broadcast.progress_message_id:
+            return
+        try:
+            await self._bot.edit_message_text(
+                get_broadcast_progress_text(broadcast, rate),
+                chat_id=broadcast.admin_chat_id,
+                message_id=broadcast.progress_message_id,
+                reply_markup=get_broadcast_progress_keyboard(broadcast.id) if broadcast.status == "running" else None,
+            )
+        except TelegramBadRequest:
+            pass # Mensaje sin cambios o borrado por el admin
+        except Exception as e:
+            logger.warning(f"Could not report progress of broadcast {broadcast.id}: {e}")
+
+
+def get_broadcast_progress_text(broadcast: Broadcast, rate: float = None) -> str:
+    processed = broadcast.sent + broadcast.failed
+    titles = {"running": "📢 Enviando notificación...", "done": "✅ Notificación enviada", "cancelled": "🛑 Notificación cancelada"}
+    lines = [
+        titles.get(broadcast.status, "📢 Notificación"),
+        f"Progreso: {processed}/{broadcast.total}",
+        f"Enviados: {broadcast.sent} | Fallidos: {broadcast.failed}",
+    ]
+    if rate:
+        remaining = max(broadcast.total - processed, 0)
+        lines.append(f"Ritmo: {rate:.1f} msg/s | Restante: ~{int(remaining / rate)} s")
+    return "\n".join(lines)
+
+
+# Instancia única: el límite de envío de Telegram es por bot, así que todas las difusiones comparten el cubo de tokens
+broadcast_engine = BroadcastEngine()
@@ -0,0 +1,70 @@
+# services/catalog_cache.py
+import time
+import logging
+from sqlalchemy import inspect
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def snapshot(obj):
+    """
+    Returns a transient copy of an ORM object with all its column values loaded.
+    Copies can be shared between sessions and updates, unlike the instance owned by one session.
+    """
+    mapper = inspect(obj).mapper
+    return mapper.class_(**{attr.key: getattr(obj, attr.key) for attr in mapper.column_attrs})
+
+
+class CatalogCache:
+    """
+    Process-wide cache for catalogs that only admins change (active missions, active rewards).
+    Admin write paths call invalidate(); the TTL bounds staleness when another process made the change.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries: dict[str, tuple[float, list]] = {}
+        self._derived: dict[tuple[str, str], tuple[list, object]] = {}
+        self.version = 0 # Cambia con cada invalidación (lo usa la caché de perfiles)
+
+    def get(self, name: str) -> list | None:
+        entry = self._entries.get(name)
+        if entry is None:
+            return None
+        expires_at, items = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[name]
+            return None
+        return items
+
+    def set(self, name: str, items: list):
+        self._entries[name] = (time.monotonic() + self.ttl_seconds, [snapshot(item) for item in items])
+        return self._entries[name][1]
+
+    def derive(self, name: str, key: str, items: list, builder):
+        """
+        Returns builder(items), computed once per cached catalog list and reused until the
+        catalog is reloaded (e.g. plain-tuple indexes that avoid ORM attribute access in hot loops).
+        """
+        cached = self._derived.get((name, key))
+        if cached is not None and cached[0] is items:
+            return cached[1]
+        value = builder(items)
+        # Guarda la lista misma (no su id, que se reutiliza al liberarla) y compara por identidad
+        self._derived[(name, key)] = (items, value)
+        return value
+
+    def invalidate(self, name: str = None):
+        self.version += 1
+        if name is None:
+            self._entries.clear()
+            self._derived.clear()
+        else:
+            self._entries.pop(name, None)
+            for derived_key in [k for k in self._derived if k[0] == name]:
+                del self._derived[derived_key]
+        logger.info(f"Catalog cache invalidated: {name or 'all'}.")
+
+
+catalog_cache = CatalogCache(Config.CATALOG_CACHE_TTL_SECONDS)
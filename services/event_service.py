@@ -0,0 +1,153 @@
+# services/event_service.py
+import datetime
+import time
+import logging
+from aiogram import Bot
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from database.models import Event
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class ActiveEventCache:
+    """
+    In-memory copy of the active events that answers "which point multiplier applies now" in O(1).
+
+    Overlapping events do not stack: the highest multiplier among the events running at that
+    moment applies. The effective multiplier is computed once and reused until the next start
+    or end time of a cached event, so events begin and end on time without a query. The cache
+    is reloaded after an admin activates or expires an event (invalidate()), and at most once
+    per Config.CATALOG_CACHE_TTL_SECONDS to pick up changes made by another process.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._events: list[tuple[datetime.datetime | None, datetime.datetime | None, int]] = [] # (inicio, fin, multiplicador)
+        self._loaded_at: float = None
+        self._multiplier = 1
+        self._valid_until: datetime.datetime | None = None # Próximo inicio o fin de un evento; None si no hay ninguno
+
+    @property
+    def stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl_seconds
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    async def refresh(self, session: AsyncSession):
+        result = await session.execute(
+            select(Event.start_time, Event.end_time, Event.multiplier).where(Event.is_active == True)
+        )
+        self._events = [(start_time, end_time, multiplier or 1) for start_time, end_time, multiplier in result.all()]
+        self._loaded_at = time.monotonic()
+        self._recompute(datetime.datetime.now())
+
+    def _recompute(self, now: datetime.datetime):
+        multiplier = 1
+        boundaries = []
+        for start_time, end_time, event_multiplier in self._events:
+            if start_time and start_time > now:
+                boundaries.append(start_time)
+                continue
+            if end_time and end_time <= now:
+                continue # Caducado aunque el job de expiración aún no lo haya desactivado
+            multiplier = max(multiplier, event_multiplier)
+            if end_time:
+                boundaries.append(end_time)
+        self._multiplier = multiplier
+        self._valid_until = min(boundaries, default=None)
+
+    def current_multiplier(self, now: datetime.datetime = None) -> int:
+        """Multiplier from the cached events, without touching the database."""
+        if self._valid_until is not None:
+            now = now or datetime.datetime.now()
+            if now >= self._valid_until:
+                self._recompute(now)
+        return self._multiplier
+
+    async def get_multiplier(self, session: AsyncSession) -> int:
+        """Current multiplier; only queries the database when the cache is invalidated or past its TTL."""
+        if self.stale:
+            await self.refresh(session)
+        return self.current_multiplier()
+
+
+active_events = ActiveEventCache(Config.CATALOG_CACHE_TTL_SECONDS)
+
+
+class EventLifecycle:
+    """
+    Ends events exactly at their end_time with one-shot APScheduler jobs instead of polling.
+
+    schedule_expiry() registers a date job when an event is created. The events table is the
+    durable job store: rehydrate() runs at startup, expires whatever ended while the bot was
+    down and re-registers a job for every active event with a future end_time. Every job runs
+    expire_due_events(), which deactivates all due events in a single UPDATE and commit, so
+    events ending together (or a backlog after downtime) cost one transaction.
+    """
+
+    def __init__(self):
+        self._scheduler: AsyncIOScheduler = None
+        self._session_factory: async_sessionmaker[AsyncSession] = None
+        self._bot: Bot = None
+
+    def configure(self, scheduler: AsyncIOScheduler, session_factory: async_sessionmaker[AsyncSession], bot: Bot):
+        self._scheduler = scheduler
+        self._session_factory = session_factory
+        self._bot = bot
+
+    def schedule_expiry(self, event_id: int, end_time: datetime.datetime):
+        if self._scheduler is None:
+            raise RuntimeError("Event lifecycle not configured. Call event_lifecycle.configure() first.")
+        self._scheduler.add_job(
+            self.expire_due_events,
+            'date',
+            run_date=end_time,
+            id=f"event_expiry_{event_id}",
+            replace_existing=True,
+            misfire_grace_time=None, # Si el bot estaba ocupado, se ejecuta igualmente con retraso
+        )
+
+    async def rehydrate(self) -> int:
+        """Expires overdue events and schedules the rest. Returns how many expiry jobs were registered."""
+        await self.expire_due_events()
+        async with self._session_factory() as session:
+            result = await session.execute(
+                select(Event.id, Event.end_time).where(Event.is_active == True, Event.end_time != None)
+            )
+            pending = result.all()
+        for event_id, end_time in pending:
+            self.schedule_expiry(event_id, end_time)
+        logger.info(f"Scheduled expiry of {len(pending)} active events.")
+        return len(pending)
+
+    async def expire_due_events(self) -> list[str]:
+        """Deactivates every active event whose end_time has passed, in one transaction. Returns their names."""
+        async with self._session_factory() as session:
+            result = await session.execute(
+                update(Event)
+                .where(Event.is_active == True, Event.end_time != None, Event.end_time <= datetime.datetime.now())
+                .values(is_active=False)
+                .returning(Event.id, Event.name)
+            )
+            expired = result.all()
+            await session.commit()
+        if not expired:
+            return []
+        active_events.invalidate()
+        for event_id, name in expired:
+            logger.info(f"Event '{name}' deactivated.")
+            try:
+                await self._bot.send_message(
+                    Config.CHANNEL_ID,
+                    f"📢 **¡Evento Finalizado!**\n\nEl evento '{name}' ha terminado.",
+                )
+            except Exception as e:
+                logger.warning(f"Could not announce the end of event {event_id}: {e}")
+        return [name for _, name in expired]
+
+
+event_lifecycle = EventLifecycle()
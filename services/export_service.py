@@ -0,0 +1,170 @@
+# services/export_service.py
+import csv
+import datetime
+import gzip
+import json
+import os
+import tempfile
+import logging
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.models import User, UserAchievement, UserMissionCompletion, ChannelReaction
+from config import Config
+
+try: # Dependencia opcional: solo necesaria para el formato Parquet
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+# (cabecera, columna) de la tabla users
+USER_EXPORT_COLUMNS = [
+    ("ID", User.id),
+    ("Username", User.username),
+    ("First Name", User.first_name),
+    ("Last Name", User.last_name),
+    ("Points", User.points),
+    ("Level", User.level),
+    ("Last Daily Mission Reset", User.last_daily_mission_reset),
+    ("Last Weekly Mission Reset", User.last_weekly_mission_reset),
+    ("Created At", User.created_at),
+    ("Updated At", User.updated_at),
+]
+
+# (cabecera, tabla, clave, fecha): se exportan por usuario como {clave: fecha ISO}, igual que las antiguas columnas JSON
+RELATED_EXPORT_COLUMNS = [
+    ("Achievements", UserAchievement, UserAchievement.achievement_id, UserAchievement.granted_at),
+    ("Missions Completed", UserMissionCompletion, UserMissionCompletion.mission_id, UserMissionCompletion.completed_at),
+    ("Channel Reactions", ChannelReaction, ChannelReaction.message_id, ChannelReaction.created_at),
+]
+
+EXPORT_HEADERS = [header for header, _ in USER_EXPORT_COLUMNS] + [header for header, *_ in RELATED_EXPORT_COLUMNS]
+
+EXPORT_EXTENSIONS = {"csv": "csv.gz", "jsonl": "jsonl.gz", "parquet": "parquet"}
+
+
+def available_export_formats() -> list[str]:
+    """Formats that can be produced in this deployment (Parquet needs pyarrow installed)."""
+    return [fmt for fmt in EXPORT_EXTENSIONS if fmt != "parquet" or pyarrow is not None]
+
+
+def _isoformat(value):
+    return value.isoformat() if isinstance(value, datetime.datetime) else value
+
+
+def _text(value):
+    """CSV/Parquet cell: related-row dicts as JSON text, datetimes as ISO strings."""
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False)
+    return _isoformat(value)
+
+
+class ExportService:
+    """
+    Streams the users table to a temporary file in constant memory.
+
+    Rows are read in batches of Config.EXPORT_BATCH_SIZE through a streaming result (server-side
+    cursor where the driver supports it), only the exported columns are selected, and each batch
+    is written before the next one is fetched, together with those users' achievements, completed
+    missions and channel reactions (one range query per table). CSV and JSONL are gzip-compressed; Parquet writes
+    one row group per batch. The caller owns the returned file and must delete it.
+    """
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def export_users(self, fmt: str = "csv", batch_size: int = None) -> tuple[str, str, int]:
+        """Returns (path, filename, row count)."""
+        if fmt not in available_export_formats():
+            raise ValueError(f"Unsupported export format '{fmt}'. Available: {', '.join(available_export_formats())}.")
+        batch_size = batch_size or Config.EXPORT_BATCH_SIZE
+        filename = f"users_data_{datetime.datetime.now():%Y%m%d_%H%M%S}.{EXPORT_EXTENSIONS[fmt]}"
+        fd, path = tempfile.mkstemp(suffix=f".{EXPORT_EXTENSIONS[fmt]}")
+        os.close(fd)
+
+        stmt = (
+            select(*(column for _, column in USER_EXPORT_COLUMNS))
+            .order_by(User.id)
+            .execution_options(yield_per=batch_size)
+        )
+        writer = {"csv": self._write_csv, "jsonl": self._write_jsonl, "parquet": self._write_parquet}[fmt]
+        try:
+            result = await self.session.stream(stmt)
+            rows = await writer(path, self._with_related(result.partitions(batch_size)))
+        except Exception:
+            os.remove(path)
+            raise
+        logger.info(f"Exported {rows} users to {fmt} ({os.path.getsize(path)} bytes).")
+        return path, filename, rows
+
+    async def _with_related(self, batches):
+        """Appends each user's achievements, completed missions and reactions, read with one query per table and batch."""
+        async for batch in batches:
+            low, high = batch[0][0], batch[-1][0] # Lote ordenado por id: basta un rango
+            related = []
+            for _, model, key, timestamp in RELATED_EXPORT_COLUMNS:
+                by_user = {}
+                result = await self.session.execute(
+                    select(model.user_id, key, timestamp).where(model.user_id >= low, model.user_id <= high)
+                )
+                for user_id, value, at in result:
+                    by_user.setdefault(user_id, {})[str(value)] = _isoformat(at)
+                related.append(by_user)
+            yield [(*row, *(by_user.get(row[0], {}) for by_user in related)) for row in batch]
+
+    @staticmethod
+    async def _write_csv(path: str, batches) -> int:
+        rows = 0
+        with gzip.open(path, "wt", encoding="utf-8", newline="") as output:
+            writer = csv.writer(output)
+            writer.writerow(EXPORT_HEADERS)
+            async for batch in batches:
+                writer.writerows([_text(value) if value is not None else "" for value in row] for row in batch)
+                rows += len(batch)
+        return rows
+
+    @staticmethod
+    async def _write_jsonl(path: str, batches) -> int:
+        rows = 0
+        keys = [header.lower().replace(" ", "_") for header in EXPORT_HEADERS]
+        with gzip.open(path, "wt", encoding="utf-8") as output:
+            async for batch in batches:
+                output.writelines(
+                    json.dumps(dict(zip(keys, map(_isoformat, row))), ensure_ascii=False) + "\n" for row in batch
+                )
+                rows += len(batch)
+        return rows
+
+    @staticmethod
+    async def _write_parquet(path: str, batches) -> int:
+        rows = 0
+        keys = [header.lower().replace(" ", "_") for header in EXPORT_HEADERS]
+        schema = pyarrow.schema([
+            ("id", pyarrow.int64()),
+            ("username", pyarrow.string()),
+            ("first_name", pyarrow.string()),
+            ("last_name", pyarrow.string()),
+            ("points", pyarrow.int64()),
+            ("level", pyarrow.int64()),
+            ("last_daily_mission_reset", pyarrow.timestamp("us")),
+            ("last_weekly_mission_reset", pyarrow.timestamp("us")),
+            ("created_at", pyarrow.timestamp("us")),
+            ("updated_at", pyarrow.timestamp("us")),
+            ("achievements", pyarrow.string()),
+            ("missions_completed", pyarrow.string()),
+            ("channel_reactions", pyarrow.string()),
+        ])
+        related = range(len(USER_EXPORT_COLUMNS), len(EXPORT_HEADERS))
+        with pyarrow.parquet.ParquetWriter(path, schema, compression="zstd") as writer:
+            async for batch in batches:
+                columns = list(zip(*batch))
+                for i in related:
+                    columns[i] = [_text(value) for value in columns[i]]
+                writer.write_table(pyarrow.Table.from_arrays(
+                    [pyarrow.array(values, type=field.type) for values, field in zip(columns, schema)],
+                    names=keys,
+                ))
+                rows += len(batch)
+        return rows
@@ -0,0 +1,89 @@
+# services/job_lease.py
+import asyncio
+import datetime
+import logging
+import os
+import socket
+import uuid
+from typing import Awaitable, Callable
+from sqlalchemy import update, or_
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Identidad de este proceso como dueño de trabajos en segundo plano
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class JobLease:
+    """
+    Ownership of a background job row (a broadcast, a season rollover) among several processes.
+
+    The model needs status, owner and heartbeat columns. acquire() claims a running job with
+    one conditional UPDATE ... RETURNING, so only one worker runs it; the owner renews the
+    heartbeat every Config.JOB_LEASE_SECONDS / 3, and another worker can take the job over only
+    once the heartbeat is older than Config.JOB_LEASE_SECONDS (its owner died without releasing).
+    """
+
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession], model, row_id: int):
+        self._session_factory = session_factory
+        self.model = model
+        self.row_id = row_id
+        self._heartbeat_task: asyncio.Task = None
+
+    def _owned(self):
+        return self.model.id == self.row_id, self.model.owner == WORKER_ID, self.model.status == "running"
+
+    async def acquire(self) -> bool:
+        model = self.model
+        now = datetime.datetime.now()
+        stale = now - datetime.timedelta(seconds=Config.JOB_LEASE_SECONDS)
+        async with self._session_factory() as session:
+            claimed = await session.scalar(
+                update(model)
+                .where(
+                    model.id == self.row_id,
+                    model.status == "running",
+                    or_(model.owner.is_(None), model.heartbeat < stale),
+                )
+                .values(owner=WORKER_ID, heartbeat=now)
+                .returning(model.id)
+            )
+            await session.commit()
+        return claimed is not None
+
+    async def renew(self) -> bool:
+        """Refreshes the heartbeat. False if the job is no longer running or another worker owns it."""
+        async with self._session_factory() as session:
+            renewed = await session.scalar(
+                update(self.model).where(*self._owned()).values(heartbeat=datetime.datetime.now()).returning(self.model.id)
+            )
+            await session.commit()
+        return renewed is not None
+
+    def keep_alive(self, on_lost: Callable[[], Awaitable[None]]):
+        """Renews the lease in the background and awaits on_lost() once it cannot be renewed."""
+        async def beat():
+            while True:
+                await asyncio.sleep(Config.JOB_LEASE_SECONDS / 3)
+                try:
+                    if not await self.renew():
+                        await on_lost()
+                        return
+                except Exception as e:
+                    logger.warning(f"Could not renew the lease of {self.model.__tablename__} {self.row_id}: {e}")
+        self._heartbeat_task = asyncio.create_task(beat())
+
+    async def release(self):
+        """Stops the heartbeat and frees the row, so an unfinished job can be resumed right away."""
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        async with self._session_factory() as session:
+            await session.execute(
+                update(self.model)
+                .where(self.model.id == self.row_id, self.model.owner == WORKER_ID)
+                .values(owner=None)
+            )
+            await session.commit()
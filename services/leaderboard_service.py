@@ -0,0 +1,145 @@
+# services/leaderboard_service.py
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sortedcontainers import SortedList
+from database.models import User
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Clave en Session.info donde se acumulan los cambios pendientes de confirmar
+_PENDING_KEY = "leaderboard_pending"
+
+
+class LeaderboardEntry:
+    """Minimal copy of the User fields the ranking needs (duck-types User in get_ranking_message)."""
+    __slots__ = ("id", "username", "first_name", "points", "level")
+
+    def __init__(self, user_id: int, username: str | None, first_name: str | None, points: int, level: int):
+        self.id = user_id
+        self.username = username
+        self.first_name = first_name
+        self.points = points
+        self.level = level
+
+
+class Leaderboard:
+    """
+    In-process ranking kept sorted by (-points, -user_id), the same order as the
+    ix_users_points_id_desc index. Top-N and a user's rank are answered in O(log n)
+    without touching the database.
+
+    It is rebuilt from the database at startup and then updated incrementally: services
+    call stage() when a user's points or level change, and the change is applied when
+    the session commits (discarded on rollback). Changes committed by other workers (or a
+    season reset run elsewhere) are picked up by the periodic rebuild every
+    Config.LEADERBOARD_REFRESH_SECONDS.
+    """
+
+    def __init__(self):
+        self._ranking = SortedList()  # (-points, -user_id)
+        self._entries: dict[int, LeaderboardEntry] = {}
+        self._changed_during_rebuild: dict[int, tuple] | None = None
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def rebuild(self, session: AsyncSession, batch_size: int = 5000):
+        """Loads every user's standing from the database, replacing the current contents."""
+        stmt = select(User.id, User.username, User.first_name, User.points, User.level).execution_options(yield_per=batch_size)
+        entries = {}
+        # Cambios locales confirmados mientras se lee: pueden ser más recientes que lo leído
+        self._changed_during_rebuild = changed = {}
+        try:
+            result = await session.stream(stmt)
+            async for rows in result.partitions(batch_size):
+                for user_id, username, first_name, points, level in rows:
+                    entries[user_id] = LeaderboardEntry(user_id, username, first_name, points or 0, level or 1)
+        finally:
+            self._changed_during_rebuild = None
+        for user_id, standing in changed.items():
+            entries[user_id] = LeaderboardEntry(user_id, *standing)
+        self._entries = entries
+        self._ranking = SortedList((-entry.points, -user_id) for user_id, entry in entries.items())
+        self.loaded = True
+        logger.debug(f"Leaderboard rebuilt with {len(entries)} users.")
+
+    def update(self, user_id: int, username: str | None, first_name: str | None, points: int, level: int):
+        if self._changed_during_rebuild is not None:
+            self._changed_during_rebuild[user_id] = (username, first_name, points, level)
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self._entries[user_id] = LeaderboardEntry(user_id, username, first_name, points, level)
+            self._ranking.add((-points, -user_id))
+            return
+        if entry.points != points:
+            self._ranking.remove((-entry.points, -user_id))
+            self._ranking.add((-points, -user_id))
+        entry.username = username
+        entry.first_name = first_name
+        entry.points = points
+        entry.level = level
+
+    def remove(self, user_id: int):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._ranking.remove((-entry.points, -user_id))
+
+    def top(self, limit: int = 10) -> list[LeaderboardEntry]:
+        return [self._entries[-negated_id] for _, negated_id in self._ranking.islice(0, limit)]
+
+    def page_after(self, cursor: tuple[int, int] | None, limit: int = 10) -> tuple[int, list[LeaderboardEntry]]:
+        """
+        Keyset page: the `limit` users ranked right after the (points, user_id) cursor,
+        or the first page when cursor is None. Returns (rank of the first entry, entries).
+        """
+        start = 0
+        if cursor is not None:
+            points, user_id = cursor
+            start = self._ranking.bisect_right((-points, -user_id))
+        keys = self._ranking.islice(start, start + limit)
+        return start + 1, [self._entries[-negated_id] for _, negated_id in keys]
+
+    def neighbors(self, user_id: int, radius: int = 2) -> tuple[int, list[LeaderboardEntry]]:
+        """The user plus up to `radius` users above and below. Returns (rank of the first entry, entries)."""
+        rank = self.rank_of(user_id)
+        if rank is None:
+            return 0, []
+        start = max(rank - 1 - radius, 0)
+        keys = self._ranking.islice(start, rank + radius)
+        return start + 1, [self._entries[-negated_id] for _, negated_id in keys]
+
+    def rank_of(self, user_id: int) -> int | None:
+        """1-based position of the user, or None if unknown."""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        return self._ranking.index((-entry.points, -user_id)) + 1
+
+    def get(self, user_id: int) -> LeaderboardEntry | None:
+        return self._entries.get(user_id)
+
+    def stage(self, session, user: User):
+        """Records the user's current standing; applied to the leaderboard when the session commits."""
+        if not self.loaded:
+            return
+        pending = session.sync_session.info.setdefault(_PENDING_KEY, {})
+        pending[user.id] = (user.username, user.first_name, user.points or 0, user.level or 1)
+
+
+leaderboard = Leaderboard()
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending_leaderboard_changes(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        for user_id, standing in pending.items():
+            leaderboard.update(user_id, *standing)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_pending_leaderboard_changes(session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
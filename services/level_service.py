@@ -1,13 +1,15 @@
+from bisect import bisect_right
+from sqlalchemy import select, update, delete, insert, func, case
 from sqlalchemy.ext.asyncio import AsyncSession
-from database.models import User
-import math
+from database.models import User, LevelThreshold
+from services.leaderboard_service import leaderboard
+from services.profile_cache import profile_cache
+from config import Config
 
 # Definición de costos de nivel
-# Key: current level, Value: points needed to reach this level from level 1
-# This table defines the CUMULATIVE points needed to reach a level.
-# Or, simpler: points needed to pass to the NEXT level.
-# Let's adjust this to be points *needed to reach the NEXT level*.
+# Key: level, Value: CUMULATIVE points needed to reach that level from level 1.
 # So, to reach Level 2, you need 10 points. To reach Level 3, you need 25 (total from start).
+# Es la curva por defecto (LEVEL_CURVE="table"); LEVEL_CURVE_TABLE o LEVEL_CURVE="formula" la sustituyen.
 LEVEL_THRESHOLDS = {
     1: 0,   # Already at level 1 with 0 points
     2: 10,  # Need 10 points to reach level 2
@@ -19,16 +21,81 @@ LEVEL_THRESHOLDS = {
     8: 550,
     9: 800,
     10: 1100,
-    # Add more levels as needed
 }
 
+
+class LevelCurve:
+    """Cumulative points needed for every level, sorted so a point total resolves with one bisect."""
+
+    def __init__(self, thresholds: list[int]):
+        if not thresholds or thresholds[0] != 0:
+            raise ValueError("A level curve must start with level 1 at 0 points.")
+        if any(b <= a for a, b in zip(thresholds, thresholds[1:])):
+            raise ValueError("Level thresholds must be strictly increasing.")
+        self.thresholds = list(thresholds)
+
+    @classmethod
+    def from_table(cls, table: dict[int, int] | list[int]) -> "LevelCurve":
+        """Builds the curve from {level: points} or from the list of thresholds starting at level 1."""
+        if isinstance(table, dict):
+            if sorted(table) != list(range(1, len(table) + 1)):
+                raise ValueError("Level table must define every level from 1 without gaps.")
+            table = [table[level] for level in range(1, len(table) + 1)]
+        return cls(table)
+
+    @classmethod
+    def from_formula(cls, base: float, exponent: float, max_level: int) -> "LevelCurve":
+        """threshold(level) = base * (level - 1) ** exponent, rounded; each level costs at least one point more."""
+        thresholds = [0]
+        for level in range(2, max_level + 1):
+            thresholds.append(max(round(base * (level - 1) ** exponent), thresholds[-1] + 1))
+        return cls(thresholds)
+
+    @property
+    def max_level(self) -> int:
+        return len(self.thresholds)
+
+    def threshold(self, level: int) -> int | float:
+        """Cumulative points needed to reach `level`; infinity past the last level."""
+        if level < 1:
+            return 0
+        return self.thresholds[level - 1] if level <= self.max_level else float('inf')
+
+    def level_for(self, points: int) -> int:
+        return max(bisect_right(self.thresholds, points or 0), 1)
+
+    def levels_for(self, points: list[int]) -> list[int]:
+        """Levels of many point totals at once."""
+        thresholds = self.thresholds
+        return [max(bisect_right(thresholds, p or 0), 1) for p in points]
+
+
+def build_level_curve() -> LevelCurve:
+    """Curve selected in the config: LEVEL_CURVE="table" (LEVEL_CURVE_TABLE or LEVEL_THRESHOLDS) or "formula"."""
+    if Config.LEVEL_CURVE == "formula":
+        return LevelCurve.from_formula(Config.LEVEL_CURVE_BASE, Config.LEVEL_CURVE_EXPONENT, Config.LEVEL_CURVE_MAX_LEVEL)
+    if Config.LEVEL_CURVE != "table":
+        raise ValueError(f"Unknown LEVEL_CURVE '{Config.LEVEL_CURVE}'. Use 'table' or 'formula'.")
+    if Config.LEVEL_CURVE_TABLE:
+        return LevelCurve.from_table([int(points) for points in Config.LEVEL_CURVE_TABLE.split(",")])
+    return LevelCurve.from_table(LEVEL_THRESHOLDS)
+
+
+# Curva activa, calculada una vez al arrancar
+level_curve = build_level_curve()
+
 def get_level_threshold(level: int) -> int:
     """Returns the cumulative points needed to reach the given level."""
-    return LEVEL_THRESHOLDS.get(level, float('inf')) # Return infinity if level is beyond defined
+    return level_curve.threshold(level) # Infinity if level is beyond the curve
+
+def compute_level(points: int, level: int = 1) -> int:
+    """Returns the level reached with `points`, starting from `level` (levels never go down)."""
+    return max(level, level_curve.level_for(points))
 
 class LevelService:
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session: AsyncSession, autocommit: bool = True):
         self.session = session
+        self.autocommit = autocommit
 
     async def check_for_level_up(self, user: User) -> bool:
         """
@@ -36,22 +103,14 @@ class LevelService:
         Updates user's level if so, and returns True.
         Can level up multiple times if points allow.
         """
-        leveled_up = False
-        while True:
-            next_level = user.level + 1
-            points_for_next_level = get_level_threshold(next_level)
-
-            if points_for_next_level == float('inf'): # Max level reached
-                break
-
-            if user.points >= points_for_next_level:
-                user.level = next_level
-                leveled_up = True
-            else:
-                break
+        new_level = compute_level(user.points, user.level)
+        leveled_up = new_level > user.level
         if leveled_up:
-            await self.session.commit()
-            await self.session.refresh(user)
+            user.level = new_level
+            leaderboard.stage(self.session, user)
+            profile_cache.stage(self.session, user.id)
+            if self.autocommit:
+                await self.session.commit()
         return leveled_up
 
     async def get_user_level(self, user_id: int) -> int:
@@ -62,7 +121,6 @@ class LevelService:
         """
         Returns (current_points_in_level, points_to_next_level_from_current_level)
         """
-        current_level_threshold = get_level_threshold(user.level)
         next_level_threshold = get_level_threshold(user.level + 1)
 
         if next_level_threshold == float('inf'): # Max level reached
@@ -71,3 +129,63 @@ class LevelService:
         points_needed_for_next_level = next_level_threshold - user.points
         return user.points, points_needed_for_next_level
 
+    async def sync_thresholds(self, curve: LevelCurve = None) -> bool:
+        """Copies `curve` (the active one by default) into level_thresholds if it changed. Returns True if rewritten."""
+        curve = curve or level_curve
+        stored = (await self.session.execute(
+            select(LevelThreshold.points).order_by(LevelThreshold.level)
+        )).scalars().all()
+        if list(stored) == curve.thresholds:
+            return False
+        await self.session.execute(delete(LevelThreshold))
+        await self.session.execute(
+            insert(LevelThreshold),
+            [{"level": level, "points": points} for level, points in enumerate(curve.thresholds, start=1)],
+        )
+        if self.autocommit:
+            await self.session.commit()
+        return True
+
+    async def _count_pending_levels(self, curve: LevelCurve) -> int:
+        """Users whose points reach the next level of `curve`, without writing anything (not even level_thresholds)."""
+        # La curva es creciente: basta comparar con el umbral del nivel siguiente al guardado (CASE nivel WHEN ...)
+        next_threshold = case(
+            {level: points for level, points in enumerate(curve.thresholds)}, # Nivel 0 (sin nivel) -> umbral del nivel 1
+            value=func.coalesce(User.level, 0),
+        )
+        pending = await self.session.scalar(
+            select(func.count(User.id)).where(func.coalesce(User.points, 0) >= next_threshold)
+        )
+        return pending or 0
+
+    async def reconcile_levels(self, dry_run: bool = False, curve: LevelCurve = None) -> int:
+        """Raises every user whose points reach a higher level, in one UPDATE (levels never go down). With dry_run only counts them."""
+        if dry_run:
+            return await self._count_pending_levels(curve or level_curve)
+        await self.sync_thresholds(curve)
+        points = func.coalesce(User.points, 0)
+        derived_level = func.coalesce(
+            select(LevelThreshold.level)
+            .where(LevelThreshold.points <= points)
+            .order_by(LevelThreshold.points.desc())
+            .limit(1)
+            .scalar_subquery(),
+            1,
+        )
+        current_level = func.coalesce(User.level, 0)
+        drifted = derived_level > current_level
+        result = await self.session.execute(
+            update(User)
+            .where(drifted)
+            .values(level=case((derived_level > current_level, derived_level), else_=current_level))
+            .returning(User.id, User.username, User.first_name, User.points, User.level)
+            .execution_options(synchronize_session=False)
+        )
+        changed = 0
+        for row in result:
+            leaderboard.stage(self.session, row)
+            profile_cache.stage(self.session, row.id)
+            changed += 1
+        if self.autocommit:
+            await self.session.commit()
+        return changed
@@ -2,125 +2,179 @@
 import datetime
 import random
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
-from database.models import Mission, User
+from sqlalchemy import select, update, exists
+from database.models import Mission, User, UserMissionCompletion
+from services.point_service import PointService
+from services.catalog_cache import catalog_cache
+from services.profile_cache import profile_cache
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Ventana durante la cual una misión periódica completada sigue bloqueada
+PERIOD_WINDOWS = {
+    "daily": datetime.timedelta(days=1),
+    "weekly": datetime.timedelta(weeks=1),
+}
+# Tipos que solo se completan una vez (las misiones de reacción cuentan como únicas fuera del handler de reacción)
+ONE_TIME_TYPES = frozenset({"one_time", "reaction"})
+
+
+def build_eligibility_index(missions: list[Mission]) -> list[tuple[str, str, Mission]]:
+    """(mission_id, type, mission) tuples, so the eligibility loop avoids ORM attribute access."""
+    return [(mission.id, mission.type, mission) for mission in missions]
+
+
+def filter_eligible_missions(index: list[tuple[str, str, Mission]], completions: dict[str, datetime.datetime], now: datetime.datetime = None) -> list[Mission]:
+    """Missions the user can still complete, in one pass over `index` (build_eligibility_index) and `completions` (get_user_completions)."""
+    now = now or datetime.datetime.now()
+    cutoffs = {mission_type: now - window for mission_type, window in PERIOD_WINDOWS.items()}
+    get_completion = completions.get
+    eligible = []
+    for mission_id, mission_type, mission in index:
+        last_completed = get_completion(mission_id)
+        if last_completed is None:
+            eligible.append(mission)
+            continue
+        cutoff = cutoffs.get(mission_type)
+        if cutoff is not None:
+            if last_completed <= cutoff:
+                eligible.append(mission)
+        elif mission_type not in ONE_TIME_TYPES:
+            eligible.append(mission) # e.g. 'event': no completion limit
+    return eligible
+
+
+def reaction_mission_matches(mission: Mission, message_id: int, reaction_type: str) -> bool:
+    """True if reacting with `reaction_type` to `message_id` fulfils the mission (without action_data any reaction does)."""
+    if not mission.requires_action:
+        return False
+    if not mission.action_data:
+        return True
+    return (
+        mission.action_data.get('target_message_id') == message_id
+        and mission.action_data.get('reaction_type') == reaction_type
+    )
+
+
 class MissionService:
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session: AsyncSession, autocommit: bool = True):
         self.session = session
+        self.autocommit = autocommit
+        self.point_service = PointService(session, autocommit=autocommit)
 
     async def get_active_missions(self, user_id: int = None, mission_type: str = None) -> list[Mission]:
-        """
-        Retrieves active missions, optionally filtered by user completion status and type.
-        """
-        stmt = select(Mission).where(Mission.is_active == True)
+        """Retrieves active missions, optionally filtered by user completion status and type."""
+        missions = catalog_cache.get("missions")
+        if missions is None:
+            result = await self.session.execute(select(Mission).where(Mission.is_active == True))
+            missions = catalog_cache.set("missions", result.scalars().all())
+        index = catalog_cache.derive("missions", "eligibility", missions, build_eligibility_index)
         if mission_type:
-            stmt = stmt.where(Mission.type == mission_type)
-        result = await self.session.execute(stmt)
-        missions = result.scalars().all()
+            index = [entry for entry in index if entry[1] == mission_type]
 
         if user_id: # Filter out completed missions for a specific user based on reset rules
-            user = await self.session.get(User, user_id)
-            if user:
-                filtered_missions = []
-                now = datetime.datetime.now()
-
-                for mission in missions:
-                    is_completed_for_period, _ = await self.check_mission_completion_status(user, mission)
-                    if not is_completed_for_period:
-                        filtered_missions.append(mission)
-                return filtered_missions
-        return missions
+            return await self.get_eligible_missions(user_id, index)
+        return [mission for _, _, mission in index]
+
+    async def get_eligible_missions(self, user_id: int, index: list[tuple[str, str, Mission]]) -> list[Mission]:
+        """Batch eligibility: one query for the user's completions, then a single filtering pass."""
+        completions = await self.get_user_completions(user_id)
+        return filter_eligible_missions(index, completions)
 
     async def get_mission_by_id(self, mission_id: str) -> Mission | None:
         return await self.session.get(Mission, mission_id)
 
-    async def check_mission_completion_status(self, user: User, mission: Mission, target_message_id: int = None) -> tuple[bool, str]:
+    async def get_user_completions(self, user_id: int) -> dict[str, datetime.datetime]:
+        """Returns {mission_id: last completion datetime} for the user."""
+        stmt = select(UserMissionCompletion.mission_id, UserMissionCompletion.completed_at).where(
+            UserMissionCompletion.user_id == user_id
+        )
+        result = await self.session.execute(stmt)
+        return dict(result.all())
+
+    async def has_completed_any(self, user_id: int) -> bool:
+        result = await self.session.execute(select(exists().where(UserMissionCompletion.user_id == user_id)))
+        return result.scalar()
+
+    async def check_mission_completion_status(self, user: User, mission: Mission, target_message_id: int = None, completions: dict[str, datetime.datetime] = None) -> tuple[bool, str]:
         """
         Checks if a user has completed a mission for the current reset period,
         or if it's a one-time mission already completed.
+        `completions` (from get_user_completions) avoids a lookup when checking many missions.
         Returns (is_completed_for_period, reason_if_completed)
         """
-        mission_completion_record = user.missions_completed.get(mission.id)
+        if completions is not None:
+            last_completed = completions.get(mission.id)
+        else:
+            record = await self.session.get(UserMissionCompletion, (user.id, mission.id))
+            last_completed = record.completed_at if record else None
         
         if mission.type == "one_time":
-            if mission_completion_record:
+            if last_completed:
                 return True, "already_completed"
         elif mission.type == "daily":
-            if mission_completion_record:
-                last_completed = datetime.datetime.fromisoformat(mission_completion_record)
-                if (datetime.datetime.now() - last_completed) < datetime.timedelta(days=1):
-                    return True, "daily_limit_reached"
+            if last_completed and (datetime.datetime.now() - last_completed) < PERIOD_WINDOWS["daily"]:
+                return True, "daily_limit_reached"
         elif mission.type == "weekly":
-            if mission_completion_record:
-                last_completed = datetime.datetime.fromisoformat(mission_completion_record)
-                if (datetime.datetime.now() - last_completed) < datetime.timedelta(weeks=1):
-                    return True, "weekly_limit_reached"
+            if last_completed and (datetime.datetime.now() - last_completed) < PERIOD_WINDOWS["weekly"]:
+                return True, "weekly_limit_reached"
         elif mission.type == "reaction":
-            # For reaction missions, check if the specific reaction for that message_id is recorded
+            # A user reacts to a given channel message only once, so a mission bound to that
+            # message is completed once as well; generic reaction missions are one-time.
             if mission.action_data and mission.action_data.get('target_message_id') == target_message_id:
-                if user.channel_reactions and str(target_message_id) in user.channel_reactions:
+                if last_completed:
                     return True, "already_reacted_to_this_message"
-            elif mission_completion_record: # If it's a generic reaction mission, check one-time completion
+            elif last_completed:
                 return True, "already_completed"
         
         return False, "" # Not completed for current period or not a one-time mission
 
-    async def complete_mission(self, user_id: int, mission_id: str, reaction_type: str = None, target_message_id: int = None) -> tuple[bool, Mission | None]:
+    async def complete_mission(self, user_id: int, mission_id: str, reaction_type: str = None, target_message_id: int = None) -> tuple[bool, Mission | None, int]:
         """
         Marks a mission as completed for a user, adds points, and handles reset logic.
-        Returns (True, mission_object) on success, (False, None) on failure.
+        Returns (True, mission_object, points_awarded) on success, (False, None, 0) on failure.
+        points_awarded includes the active event multiplier.
         """
         user = await self.session.get(User, user_id)
         mission = await self.session.get(Mission, mission_id)
 
         if not user or not mission or not mission.is_active:
             logger.warning(f"Failed to complete mission: User {user_id} or mission {mission_id} not found or inactive.")
-            return False, None
+            return False, None, 0
 
         # Check if already completed for the current period
-        is_completed, reason = await self.check_mission_completion_status(user, mission, target_message_id)
+        record = await self.session.get(UserMissionCompletion, (user_id, mission.id))
+        completions = {mission.id: record.completed_at} if record else {}
+        is_completed, reason = await self.check_mission_completion_status(user, mission, target_message_id, completions=completions)
         if is_completed:
             logger.info(f"User {user_id} attempted to complete mission {mission_id} but it was already completed ({reason}).")
-            return False, None
-
-        # Add mission to user's completed list with timestamp
-        now = datetime.datetime.now().isoformat()
-        user.missions_completed[mission.id] = now
-        
-        # Specific handling for reaction missions: record the message_id for which the reaction was given
-        if mission.type == "reaction" and mission.requires_action and target_message_id:
-            if not user.channel_reactions:
-                user.channel_reactions = {}
-            user.channel_reactions[str(target_message_id)] = now  # Record the reaction for this specific message
-
-        # Add points to user. Event multiplier should be handled by PointService or calling context.
-        # For simplicity here, we just add the base points.
-        # If event multiplier logic is outside this, ensure it's applied before calling add_points.
-        # If it's inside PointService, this is fine.
-        point_service = self.point_service # assuming point_service is still available in __init__
-        if not hasattr(self, 'point_service'): # Fallback if not initialized in __init__
-             from services.point_service import PointService
-             point_service = PointService(self.session)
-
-        await point_service.add_points(user_id, mission.points_reward)
+            return False, None, 0
+
+        # Record (or refresh, for daily/weekly missions) the completion timestamp
+        now = datetime.datetime.now()
+        if record:
+            record.completed_at = now
+        else:
+            self.session.add(UserMissionCompletion(user_id=user_id, mission_id=mission.id, completed_at=now))
+        profile_cache.stage(self.session, user_id) # La misión deja de aparecer como activa
+        # The channel reaction itself is recorded by the reaction handler (ChannelReaction)
+
+        # Add points to user, multiplied by the active event (if any).
+        # The point service shares this service's session and autocommit mode, so inside a
+        # UnitOfWork everything lands in the same transaction.
+        _, awarded = await self.point_service.award_points(user_id, mission.points_reward)
 
         # Update last reset timestamps for daily/weekly missions
         if mission.type == "daily":
             user.last_daily_mission_reset = datetime.datetime.now()
         elif mission.type == "weekly":
             user.last_weekly_mission_reset = datetime.datetime.now()
-        
-        # Ensure JSON field updates are marked for SQLAlchemy
-        self.session.add(user) # Mark user as modified
 
-        await self.session.commit()
-        await self.session.refresh(user)
+        if self.autocommit:
+            await self.session.commit()
         logger.info(f"User {user_id} successfully completed mission {mission_id} (Type: {mission.type}, Message: {target_message_id}).")
-        return True, mission
+        return True, mission, awarded
 
     async def create_mission(self, name: str, description: str, points_reward: int, mission_type: str, requires_action: bool = False, action_data: dict = None) -> Mission:
         mission_id = f"{mission_type}_{name.lower().replace(' ', '_').replace('.', '').replace(',', '')}" # Simple ID generation
@@ -137,6 +191,7 @@ class MissionService:
         self.session.add(new_mission)
         await self.session.commit()
         await self.session.refresh(new_mission)
+        catalog_cache.invalidate("missions")
         return new_mission
 
     async def toggle_mission_status(self, mission_id: str, status: bool) -> bool:
@@ -144,5 +199,6 @@ class MissionService:
         if mission:
             mission.is_active = status
             await self.session.commit()
+            catalog_cache.invalidate("missions")
             return True
         return False
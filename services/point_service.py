@@ -1,37 +1,61 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
+from sqlalchemy import select, update, func, tuple_
 from database.models import User
+from services.leaderboard_service import leaderboard
+from services.event_service import active_events
+from services.profile_cache import profile_cache
 import logging
 
 logger = logging.getLogger(__name__)
 
 class PointService:
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session: AsyncSession, autocommit: bool = True):
         self.session = session
+        self.autocommit = autocommit
+
+    async def _apply_points_delta(self, user_id: int, delta: int, min_balance: int | None = None) -> User | None:
+        """Applies `points = points + delta` in the database and returns the updated user (only while points >= min_balance, if given)."""
+        stmt = update(User).where(User.id == user_id)
+        if min_balance is not None:
+            stmt = stmt.where(User.points >= min_balance)
+        stmt = (
+            stmt.values(points=User.points + delta)
+            .returning(User)
+            .execution_options(populate_existing=True)
+        )
+        result = await self.session.execute(stmt)
+        return result.scalar_one_or_none()
 
     async def add_points(self, user_id: int, points: int) -> User:
-        user = await self.session.get(User, user_id)
+        user = await self._apply_points_delta(user_id, points)
         if not user:
             # If user somehow doesn't exist, create a placeholder.
             # In a real bot, user should be created on /start.
             logger.warning(f"Attempted to add points to non-existent user {user_id}. Creating new user.")
-            user = User(id=user_id, points=0) # Initialize with 0 points
+            user = User(id=user_id, points=points, level=1)
             self.session.add(user)
-            await self.session.commit()
-            await self.session.refresh(user)
 
-        user.points += points
-        await self.session.commit()
-        await self.session.refresh(user)
+        leaderboard.stage(self.session, user)
+        profile_cache.stage(self.session, user_id)
+        if self.autocommit:
+            await self.session.commit()
         logger.info(f"User {user_id} gained {points} points. Total: {user.points}")
         return user
 
+    async def award_points(self, user_id: int, base_points: int) -> tuple[User, int]:
+        """Adds gameplay points times the active event multiplier. Returns (user, points awarded)."""
+        awarded = base_points * await active_events.get_multiplier(self.session)
+        user = await self.add_points(user_id, awarded)
+        return user, awarded
+
     async def deduct_points(self, user_id: int, points: int) -> User | None:
-        user = await self.session.get(User, user_id)
-        if user and user.points >= points:
-            user.points -= points
-            await self.session.commit()
-            await self.session.refresh(user)
+        # Conditional decrement: the balance check and the update happen atomically in the same statement
+        user = await self._apply_points_delta(user_id, -points, min_balance=points)
+        if user:
+            leaderboard.stage(self.session, user)
+            profile_cache.stage(self.session, user_id)
+            if self.autocommit:
+                await self.session.commit()
             logger.info(f"User {user_id} lost {points} points. Total: {user.points}")
             return user
         logger.warning(f"Failed to deduct {points} points from user {user_id}. Not enough points or user not found.")
@@ -42,8 +66,41 @@ class PointService:
         return user.points if user else 0
 
     async def get_top_users(self, limit: int = 10) -> list[User]:
-        """Return the top users ordered by points."""
-        stmt = select(User).order_by(User.points.desc()).limit(limit)
+        """Return the top users ordered by points (from the in-memory leaderboard once loaded)."""
+        if leaderboard.loaded:
+            return leaderboard.top(limit)
+        stmt = select(User).order_by(User.points.desc(), User.id.desc()).limit(limit)
         result = await self.session.execute(stmt)
         top_users = result.scalars().all()
         return top_users
+
+    async def get_leaderboard_page(self, cursor: tuple[int, int] | None = None, limit: int = 10, start_rank: int = 1) -> tuple[int, list[User]]:
+        """Keyset page of `limit` users after the (points, user_id) cursor. Returns (rank of the first user, users)."""
+        if leaderboard.loaded:
+            return leaderboard.page_after(cursor, limit)
+
+        stmt = select(User).order_by(User.points.desc(), User.id.desc()).limit(limit)
+        if cursor is not None:
+            stmt = stmt.where(tuple_(User.points, User.id) < tuple_(*cursor))
+        result = await self.session.execute(stmt)
+        return start_rank, result.scalars().all()
+
+    async def get_user_rank(self, user_id: int, radius: int = 2) -> tuple[int | None, int, list[User]]:
+        """Returns (user's rank or None, rank of the first neighbor, the user and up to `radius` users around)."""
+        if leaderboard.loaded:
+            rank = leaderboard.rank_of(user_id)
+            start_rank, neighbors = leaderboard.neighbors(user_id, radius)
+            return rank, start_rank, neighbors
+
+        user = await self.session.get(User, user_id)
+        if not user:
+            return None, 0, []
+        position = tuple_(User.points, User.id)
+        user_position = tuple_(user.points, user.id)
+        count_stmt = select(func.count()).select_from(User).where(position > user_position)
+        rank = (await self.session.execute(count_stmt)).scalar_one() + 1
+        above_stmt = select(User).where(position > user_position).order_by(User.points, User.id).limit(radius)
+        below_stmt = select(User).where(position < user_position).order_by(User.points.desc(), User.id.desc()).limit(radius)
+        above = list(reversed((await self.session.execute(above_stmt)).scalars().all()))
+        below = (await self.session.execute(below_stmt)).scalars().all()
+        return rank, rank - len(above), above + [user] + list(below)
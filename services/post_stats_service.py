@@ -0,0 +1,106 @@
+# services/post_stats_service.py
+import asyncio
+import logging
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramBadRequest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.models import ChannelPostStats
+from database.setup import dialect_insert
+from utils.keyboard_utils import get_reaction_keyboard
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class PostStatsService:
+    def __init__(self, session: AsyncSession, autocommit: bool = True):
+        self.session = session
+        self.autocommit = autocommit
+
+    async def register_post(self, message_id: int, chat_id: int) -> ChannelPostStats:
+        """Creates the (empty) counters of a newly published channel post."""
+        stats = ChannelPostStats(message_id=message_id, chat_id=chat_id, likes=0, dislikes=0)
+        self.session.add(stats)
+        if self.autocommit:
+            await self.session.commit()
+        return stats
+
+    async def add_reactions(self, counts: dict[int, tuple[int, int]], chat_id: int) -> list[tuple[int, int, int, int]]:
+        """Adds {message_id: (likes, dislikes)} to the counters in one statement. Returns the new (message_id, chat_id, likes, dislikes) totals."""
+        stmt = dialect_insert(self.session, ChannelPostStats).values([
+            {"message_id": message_id, "chat_id": chat_id, "likes": likes, "dislikes": dislikes}
+            for message_id, (likes, dislikes) in counts.items()
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ChannelPostStats.message_id],
+            set_={
+                "likes": ChannelPostStats.likes + stmt.excluded.likes,
+                "dislikes": ChannelPostStats.dislikes + stmt.excluded.dislikes,
+            },
+        ).returning(ChannelPostStats.message_id, ChannelPostStats.chat_id, ChannelPostStats.likes, ChannelPostStats.dislikes)
+        totals = (await self.session.execute(stmt)).all()
+        if self.autocommit:
+            await self.session.commit()
+        return totals
+
+    async def get_recent_posts(self, limit: int = 10) -> list[ChannelPostStats]:
+        """Counters of the latest channel posts (primary key order, no scan of the reactions table)."""
+        result = await self.session.execute(
+            select(ChannelPostStats).order_by(ChannelPostStats.message_id.desc()).limit(limit)
+        )
+        return result.scalars().all()
+
+
+class ReactionKeyboardUpdater:
+    """Edits the counts on the posts' reaction buttons with the latest totals, one edit every REACTION_KEYBOARD_EDIT_INTERVAL_SECONDS."""
+
+    def __init__(self):
+        self._bot: Bot = None
+        self._dirty: dict[int, tuple[int, int, int]] = {} # message_id -> (chat_id, likes, dislikes), en orden de llegada
+        self._task: asyncio.Task = None
+
+    def configure(self, bot: Bot):
+        self._bot = bot
+
+    def start(self):
+        if self._bot is None:
+            raise RuntimeError("Reaction keyboard updater not configured. Call reaction_keyboard_updater.configure() first.")
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def mark(self, message_id: int, chat_id: int, likes: int, dislikes: int):
+        # Si ya estaba pendiente conserva su turno en la cola y solo se actualizan los totales
+        self._dirty[message_id] = (chat_id, likes, dislikes)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(Config.REACTION_KEYBOARD_EDIT_INTERVAL_SECONDS)
+            if not self._dirty:
+                continue
+            message_id = next(iter(self._dirty))
+            chat_id, likes, dislikes = self._dirty.pop(message_id)
+            try:
+                await self._bot.edit_message_reply_markup(
+                    chat_id=chat_id,
+                    message_id=message_id,
+                    reply_markup=get_reaction_keyboard(message_id, likes, dislikes),
+                )
+            except TelegramRetryAfter as e:
+                # Se reintenta tras la espera, salvo que ya haya totales más nuevos
+                self._dirty.setdefault(message_id, (chat_id, likes, dislikes))
+                await asyncio.sleep(e.retry_after)
+            except TelegramBadRequest:
+                pass # Sin cambios o mensaje borrado
+            except Exception as e:
+                logger.warning(f"Could not update reaction counts of message {message_id}: {e}")
+
+
+# Instancia única: el límite de ediciones es por chat, así que todas las publicaciones comparten el turno
+reaction_keyboard_updater = ReactionKeyboardUpdater()
@@ -0,0 +1,88 @@
+# services/profile_cache.py
+import time
+import logging
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from services.catalog_cache import catalog_cache
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Clave en Session.info donde se acumulan los usuarios cuyo perfil cambia al confirmar
+_PENDING_KEY = "profile_cache_pending"
+
+
+class ProfileCache:
+    """
+    Rendered profile text per user, reused while nothing shown in it has changed.
+
+    An entry is valid for the user's version counter and the catalog version it was rendered
+    with. Services call stage() whenever they write points, level, achievements or mission
+    completions; the user's version is bumped when the session commits (discarded on rollback),
+    and catalog_cache.invalidate() (admin catalog changes) moves the catalog version. A render
+    started before a bump is never stored, because put() checks the key read before rendering.
+    The TTL bounds time-dependent content (daily and weekly missions becoming available again)
+    and changes made by another process.
+    """
+
+    def __init__(self, capacity: int, ttl_seconds: float):
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[int, tuple[tuple, float, str]] = OrderedDict() # user_id -> (clave, caducidad, texto)
+        self._versions: dict[int, int] = {}
+        self._generation = 0 # Cambia con clear(), para que las versiones puedan volver a empezar
+
+    def key(self, user_id: int) -> tuple:
+        """Version key to read before rendering and hand back to put()."""
+        return self._generation, self._versions.get(user_id, 0), catalog_cache.version
+
+    def get(self, user_id: int) -> str | None:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        key, expires_at, text = entry
+        if key != self.key(user_id) or time.monotonic() >= expires_at:
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return text
+
+    def put(self, user_id: int, key: tuple, text: str):
+        if key != self.key(user_id):
+            return # El perfil cambió mientras se generaba
+        self._entries[user_id] = (key, time.monotonic() + self.ttl_seconds, text)
+        self._entries.move_to_end(user_id)
+        if len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def bump(self, user_id: int):
+        self._entries.pop(user_id, None)
+        self._versions[user_id] = self._versions.get(user_id, 0) + 1
+        if len(self._versions) > self.capacity:
+            self.clear() # Acota la memoria de los contadores
+
+    def clear(self):
+        self._generation += 1
+        self._entries.clear()
+        self._versions.clear()
+
+    def stage(self, session, user_id: int):
+        """Marks the user's profile as changed; applied when the session commits."""
+        session.sync_session.info.setdefault(_PENDING_KEY, set()).add(user_id)
+
+
+profile_cache = ProfileCache(Config.PROFILE_CACHE_SIZE, Config.PROFILE_CACHE_TTL_SECONDS)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending_profile_changes(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        for user_id in pending:
+            profile_cache.bump(user_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_pending_profile_changes(session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,194 @@
+# services/reaction_pipeline.py
+import asyncio
+import datetime
+import logging
+from aiogram import Bot
+from sqlalchemy import select, update, bindparam, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from database.models import User, ChannelReaction, UserMissionCompletion
+from database.setup import dialect_insert
+from services.level_service import compute_level
+from services.mission_service import MissionService, reaction_mission_matches
+from services.leaderboard_service import leaderboard, LeaderboardEntry
+from services.broadcast_service import send_limiter
+from services.post_stats_service import PostStatsService, reaction_keyboard_updater
+from services.event_service import active_events
+from services.profile_cache import profile_cache
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Puntos base por reacción
+REACTION_POINTS = {"like": 10, "dislike": 5}
+
+_users_table = User.__table__
+# Suma de puntos por usuario en una sola sentencia ejecutada en lote (executemany)
+_ADD_POINTS = (
+    update(_users_table)
+    .where(_users_table.c.id == bindparam("user_id"))
+    .values(points=_users_table.c.points + bindparam("delta"))
+)
+_SET_LEVEL = update(_users_table).where(_users_table.c.id == bindparam("user_id")).values(level=bindparam("new_level"))
+
+
+class ReactionPipeline:
+    """Pays stored channel reactions (processed_at IS NULL) in batches: points, missions, levels and post counters in one transaction each."""
+
+    def __init__(self):
+        self._session_factory: async_sessionmaker[AsyncSession] = None
+        self._bot: Bot = None
+        self._submitted = 0 # Reacciones insertadas desde el último lote
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task = None
+        self._notify_tasks: set[asyncio.Task] = set() # Referencias para que el recolector no cancele los envíos
+        self._flush_lock = asyncio.Lock()
+
+    def configure(self, session_factory: async_sessionmaker[AsyncSession], bot: Bot):
+        self._session_factory = session_factory
+        self._bot = bot
+
+    def start(self):
+        if self._session_factory is None:
+            raise RuntimeError("Reaction pipeline not configured. Call reaction_pipeline.configure() first.")
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stops the flush loop, processes what is already stored and waits for pending notifications."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        if self._notify_tasks:
+            await asyncio.gather(*self._notify_tasks, return_exceptions=True)
+
+    @staticmethod
+    async def record(session: AsyncSession, user_id: int, message_id: int, reaction_type: str) -> bool:
+        """Inserts the reaction in the caller's transaction. False if the user had already reacted to the message."""
+        stmt = dialect_insert(session, ChannelReaction).values(
+            user_id=user_id, message_id=message_id, reaction_type=reaction_type, created_at=datetime.datetime.now()
+        ).on_conflict_do_nothing().returning(ChannelReaction.user_id)
+        return (await session.execute(stmt)).first() is not None
+
+    def notify(self):
+        """Called after a reaction is committed; wakes the loop early once a full batch is waiting."""
+        self._submitted += 1
+        if self._submitted >= Config.REACTION_BATCH_SIZE:
+            self._wakeup.set()
+
+    async def _run(self):
+        interval = Config.REACTION_FLUSH_INTERVAL_MS / 1000
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Could not process stored reactions, retrying: {e}")
+
+    async def flush(self):
+        """Processes stored reactions until none is left unprocessed."""
+        async with self._flush_lock:
+            self._submitted = 0
+            while True:
+                processed, notifications = await self._process_batch()
+                if notifications:
+                    task = asyncio.create_task(self._notify(notifications))
+                    self._notify_tasks.add(task)
+                    task.add_done_callback(self._notify_tasks.discard)
+                if processed < Config.REACTION_BATCH_SIZE:
+                    return
+
+    async def _process_batch(self) -> tuple[int, dict[int, list[str]]]:
+        """Claims and aggregates one batch in a single transaction. Returns (reactions processed, messages per user)."""
+        notifications: dict[int, list[str]] = {}
+        async with self._session_factory() as session:
+            # Reclama las reacciones pendientes: las filas bloqueadas por otro worker se saltan
+            pending = (
+                select(ChannelReaction.user_id, ChannelReaction.message_id)
+                .where(ChannelReaction.processed_at.is_(None))
+                .order_by(ChannelReaction.created_at)
+                .limit(Config.REACTION_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+            )
+            claimed = (await session.execute(
+                update(ChannelReaction)
+                .where(
+                    tuple_(ChannelReaction.user_id, ChannelReaction.message_id).in_(pending),
+                    ChannelReaction.processed_at.is_(None),
+                )
+                .values(processed_at=datetime.datetime.now())
+                .returning(ChannelReaction.user_id, ChannelReaction.message_id, ChannelReaction.reaction_type)
+                .execution_options(synchronize_session=False)
+            )).all()
+            if not claimed:
+                return 0, notifications
+
+            # Un solo multiplicador por lote, leído de la caché de eventos activos
+            multiplier = await active_events.get_multiplier(session)
+            deltas: dict[int, int] = {}
+            post_counts: dict[int, tuple[int, int]] = {}
+            for user_id, message_id, reaction_type in claimed:
+                deltas[user_id] = deltas.get(user_id, 0) + REACTION_POINTS.get(reaction_type, 0) * multiplier
+                likes, dislikes = post_counts.get(message_id, (0, 0))
+                post_counts[message_id] = (likes + (reaction_type == "like"), dislikes + (reaction_type == "dislike"))
+            # Contadores por publicación, sumados en la misma transacción
+            post_totals = await PostStatsService(session, autocommit=False).add_reactions(post_counts, Config.CHANNEL_ID)
+
+            # Misiones de reacción: únicas por usuario, registradas con inserción idempotente
+            missions = await MissionService(session).get_active_missions(mission_type="reaction")
+            completions = {}
+            for user_id, message_id, reaction_type in claimed:
+                for mission in missions:
+                    if (user_id, mission.id) not in completions and reaction_mission_matches(mission, message_id, reaction_type):
+                        completions[(user_id, mission.id)] = mission
+            if completions:
+                now = datetime.datetime.now()
+                stmt = dialect_insert(session, UserMissionCompletion).values([
+                    {"user_id": user_id, "mission_id": mission_id, "completed_at": now} for user_id, mission_id in completions
+                ]).on_conflict_do_nothing().returning(UserMissionCompletion.user_id, UserMissionCompletion.mission_id)
+                for user_id, mission_id in (await session.execute(stmt)).all():
+                    mission = completions[(user_id, mission_id)]
+                    awarded = mission.points_reward * multiplier
+                    deltas[user_id] += awarded
+                    notifications.setdefault(user_id, []).append(
+                        f"🎉 ¡Misión completada: **{mission.name}**! Ganaste `{awarded}` puntos adicionales."
+                    )
+
+            await session.execute(_ADD_POINTS, [{"user_id": user_id, "delta": delta} for user_id, delta in deltas.items()])
+
+            standings = (await session.execute(
+                select(User.id, User.username, User.first_name, User.points, User.level).where(User.id.in_(deltas))
+            )).all()
+            level_changes = []
+            for user_id, username, first_name, points, level in standings:
+                new_level = compute_level(points or 0, level or 1)
+                if new_level > (level or 1):
+                    level_changes.append({"user_id": user_id, "new_level": new_level})
+                    notifications.setdefault(user_id, []).append(f"✨ ¡Felicidades! Has subido al nivel `{new_level}`.")
+                leaderboard.stage(session, LeaderboardEntry(user_id, username, first_name, points or 0, new_level))
+                profile_cache.stage(session, user_id)
+            if level_changes:
+                await session.execute(_SET_LEVEL, level_changes)
+
+            await session.commit()
+        for message_id, chat_id, likes, dislikes in post_totals:
+            reaction_keyboard_updater.mark(message_id, chat_id, likes, dislikes)
+        logger.info(f"Processed {len(claimed)} reactions, {len(deltas)} users credited.")
+        return len(claimed), notifications
+
+    async def _notify(self, notifications: dict[int, list[str]]):
+        for user_id, lines in notifications.items():
+            await send_limiter.acquire() # Tras un post popular pueden ser miles de mensajes
+            try:
+                await self._bot.send_message(user_id, "\n\n".join(lines))
+            except Exception as e:
+                logger.warning(f"Could not notify user {user_id} about reaction rewards: {e}")
+
+
+# Instancia única: todas las reacciones del proceso pasan por el mismo búfer
+reaction_pipeline = ReactionPipeline()
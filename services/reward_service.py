@@ -1,18 +1,25 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from database.models import Reward, User
+from services.point_service import PointService
+from services.catalog_cache import catalog_cache
 import logging
 
 logger = logging.getLogger(__name__)
 
 class RewardService:
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session: AsyncSession, autocommit: bool = True):
         self.session = session
+        self.autocommit = autocommit
 
     async def get_active_rewards(self) -> list[Reward]:
-        stmt = select(Reward).where(Reward.is_active == True)
-        result = await self.session.execute(stmt)
-        return result.scalars().all()
+        """Active rewards, served from the process-wide catalog cache (transient copies of the rows)."""
+        rewards = catalog_cache.get("rewards")
+        if rewards is None:
+            stmt = select(Reward).where(Reward.is_active == True)
+            result = await self.session.execute(stmt)
+            rewards = catalog_cache.set("rewards", result.scalars().all())
+        return rewards
 
     async def get_reward_by_id(self, reward_id: int) -> Reward | None:
         return await self.session.get(Reward, reward_id)
@@ -34,7 +41,10 @@ class RewardService:
             logger.info(f"User {user_id} attempted to buy {reward.name} but has insufficient points ({user.points}/{reward.cost}).")
             return False, f"No tienes suficientes puntos. Necesitas {reward.cost - user.points} puntos más."
 
-        user.points -= reward.cost
+        # Atomic guarded deduction: a concurrent purchase cannot spend the same points twice
+        point_service = PointService(self.session, autocommit=False)
+        if not await point_service.deduct_points(user_id, reward.cost):
+            return False, f"No tienes suficientes puntos. Necesitas {reward.cost - user.points} puntos más."
         if reward.stock != -1:
             reward.stock -= 1
 
@@ -42,9 +52,8 @@ class RewardService:
         # For now, just log it. A real system would integrate with an external reward fulfillment.
         logger.info(f"User {user_id} successfully purchased reward {reward.name} (ID: {reward_id}) for {reward.cost} points.")
 
-        await self.session.commit()
-        await self.session.refresh(user)
-        await self.session.refresh(reward) # Refresh reward to show updated stock
+        if self.autocommit:
+            await self.session.commit()
         return True, "Compra exitosa. ¡Disfruta tu recompensa!"
 
     async def create_reward(self, name: str, description: str, cost: int, stock: int = -1) -> Reward:
@@ -52,6 +61,7 @@ class RewardService:
         self.session.add(new_reward)
         await self.session.commit()
         await self.session.refresh(new_reward)
+        catalog_cache.invalidate("rewards")
         logger.info(f"New reward '{name}' created by admin.")
         return new_reward
 
@@ -60,6 +70,7 @@ class RewardService:
         if reward:
             reward.is_active = status
             await self.session.commit()
+            catalog_cache.invalidate("rewards")
             logger.info(f"Reward '{reward.name}' status set to {status}.")
             return True
         logger.warning(f"Failed to toggle status for reward {reward_id}. Not found.")
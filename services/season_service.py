@@ -0,0 +1,240 @@
+# services/season_service.py
+import asyncio
+import datetime
+import time
+import logging
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from sqlalchemy import select, update, delete, insert, func, literal, or_
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from database.models import User, UserAchievement, UserMissionCompletion, Season, SeasonArchive
+from services.job_lease import JobLease, WORKER_ID
+from services.leaderboard_service import leaderboard
+from services.profile_cache import profile_cache
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto se edita el mensaje de progreso del admin
+PROGRESS_INTERVAL_SECONDS = 5
+
+
+class SeasonRollover:
+    """
+    Closes the current season in the background, in id-range batches.
+
+    Each batch is one short transaction: it advances the checkpoint in the seasons row, copies
+    the users' final points and level into season_archive, resets them and deletes their
+    achievements and mission completions. Channel reactions are kept: they are what stops a
+    user from reacting (and being paid, and counted in channel_post_stats) twice to the same
+    post. Locks are held for one batch only, so reactions and missions keep being served while
+    the rollover runs. Progress is reported by editing the admin's message.
+
+    With several workers the rollover runs in the one holding its lease (JobLease); each batch
+    only commits while that worker still owns the row. resume_pending() runs at startup and
+    periodically and takes over a rollover whose owner died, from its checkpoint.
+    """
+
+    def __init__(self):
+        self._session_factory: async_sessionmaker[AsyncSession] = None
+        self._bot: Bot = None
+        self._task: asyncio.Task = None
+
+    def configure(self, session_factory: async_sessionmaker[AsyncSession], bot: Bot):
+        self._session_factory = session_factory
+        self._bot = bot
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, session: AsyncSession, admin_chat_id: int = None, progress_message_id: int = None) -> Season | None:
+        """
+        Opens a new season rollover and launches it. A rollover that stopped on an error is
+        relaunched from its checkpoint instead. Returns None if one is already in progress here or
+        in another live worker.
+        """
+        if self.running:
+            return None
+        pending = await session.scalar(select(Season).where(Season.status == "running"))
+        if pending is not None:
+            if pending.owner is not None and pending.heartbeat >= self._stale_before():
+                return None # Otro worker lo está ejecutando
+            pending.admin_chat_id = admin_chat_id
+            pending.progress_message_id = progress_message_id
+            await session.commit()
+            self._launch(pending.id)
+            return pending
+        total = await session.scalar(select(func.count(User.id)))
+        season = Season(
+            status="running",
+            admin_chat_id=admin_chat_id,
+            progress_message_id=progress_message_id,
+            last_user_id=0,
+            total=total or 0,
+            processed=0,
+        )
+        session.add(season)
+        await session.commit()
+        self._launch(season.id)
+        return season
+
+    @staticmethod
+    def _stale_before() -> datetime.datetime:
+        return datetime.datetime.now() - datetime.timedelta(seconds=Config.JOB_LEASE_SECONDS)
+
+    async def resume_pending(self) -> bool:
+        """Tries to take over a running rollover that no live worker owns. Returns True if one was launched here."""
+        if self.running:
+            return False
+        async with self._session_factory() as session:
+            season_id = await session.scalar(
+                select(Season.id).where(
+                    Season.status == "running",
+                    or_(Season.owner.is_(None), Season.heartbeat < self._stale_before()),
+                )
+            )
+        if season_id is None:
+            return False
+        self._launch(season_id) # _run solo continúa si consigue la reserva
+        return True
+
+    async def _on_lease_lost(self):
+        logger.warning("Season rollover lease lost to another worker; stopping here.")
+        if self._task is not None:
+            self._task.cancel()
+
+    def _launch(self, season_id: int):
+        if self._session_factory is None:
+            raise RuntimeError("Season rollover not configured. Call season_rollover.configure() first.")
+        self._task = asyncio.create_task(self._run(season_id))
+
+    async def _run(self, season_id: int):
+        lease = JobLease(self._session_factory, Season, season_id)
+        if not await lease.acquire():
+            return # Terminado o en manos de otro worker
+        lease.keep_alive(self._on_lease_lost)
+        try:
+            await self._run_batches(season_id)
+        finally:
+            await lease.release()
+
+    async def _run_batches(self, season_id: int):
+        async with self._session_factory() as session:
+            season = await session.get(Season, season_id)
+        if season is None or season.status != "running":
+            return
+        if season.last_user_id:
+            logger.info(f"Resuming season rollover {season_id} from user {season.last_user_id}.")
+
+        last_report = 0.0
+        try:
+            while True:
+                processed = await self._process_batch(season)
+                if not processed:
+                    break
+                now = time.monotonic()
+                if now - last_report >= PROGRESS_INTERVAL_SECONDS:
+                    last_report = now
+                    await self._report(season)
+                # Cede el turno a las actualizaciones en curso entre lotes
+                await asyncio.sleep(Config.SEASON_RESET_PAUSE_SECONDS)
+
+            async with self._session_factory() as session:
+                await session.execute(
+                    update(Season)
+                    .where(Season.id == season.id, Season.owner == WORKER_ID)
+                    .values(status="done", finished_at=datetime.datetime.now())
+                )
+                await session.commit()
+                season.status = "done"
+                # Corrige cualquier desajuste con puntos sumados mientras se reseteaba
+                await leaderboard.rebuild(session)
+            logger.info(f"Season {season.id} closed: {season.processed} users archived and reset.")
+            await self._report(season)
+        except asyncio.CancelledError:
+            raise # Apagado del bot: se reanuda desde el último punto de control
+        except Exception as e:
+            logger.error(f"Season rollover {season.id} stopped at user {season.last_user_id}: {e}")
+            await self._report(season, error=str(e))
+
+    async def _process_batch(self, season: Season) -> int:
+        """Archives and resets the next id range in a single transaction. Returns the number of users processed."""
+        async with self._session_factory() as session:
+            user_ids = (await session.execute(
+                select(User.id)
+                .where(User.id > season.last_user_id)
+                .order_by(User.id)
+                .limit(Config.SEASON_RESET_BATCH_SIZE)
+            )).scalars().all()
+            if not user_ids:
+                return 0
+            low, high = season.last_user_id, user_ids[-1]
+            in_range = User.id > low, User.id <= high
+            processed = season.processed + len(user_ids)
+
+            # Primero el punto de control, condicionado a seguir siendo el dueño y a partir del mismo
+            # punto: si otro worker tomó el reseteo, el lote se descarta sin tocar nada
+            claimed = await session.scalar(
+                update(Season)
+                .where(Season.id == season.id, Season.owner == WORKER_ID, Season.last_user_id == low)
+                .values(last_user_id=high, processed=processed)
+                .returning(Season.id)
+            )
+            if claimed is None:
+                await session.rollback()
+                await self._on_lease_lost()
+                return 0
+
+            await session.execute(
+                insert(SeasonArchive).from_select(
+                    ["season_id", "user_id", "points", "level"],
+                    select(literal(season.id), User.id, User.points, User.level).where(*in_range),
+                )
+            )
+            reset = await session.execute(
+                update(User)
+                .where(*in_range)
+                .values(points=0, level=1)
+                .returning(User.id, User.username, User.first_name, User.points, User.level)
+            )
+            for row in reset:
+                leaderboard.stage(session, row)
+                profile_cache.stage(session, row.id)
+            # Las reacciones se conservan: evitan volver a reaccionar (y contar) en publicaciones antiguas
+            for model in (UserAchievement, UserMissionCompletion):
+                await session.execute(delete(model).where(model.user_id > low, model.user_id <= high))
+            await session.commit()
+        season.last_user_id = high
+        season.processed = processed
+        return len(user_ids)
+
+    async def _report(self, season: Season, error: str = None):
+        """Edits the admin's progress message. Reporting failures never stop the rollover."""
+        if self._bot is None or not season.admin_chat_id or not season.progress_message_id:
+            return
+        try:
+            await self._bot.edit_message_text(
+                get_season_progress_text(season, error),
+                chat_id=season.admin_chat_id,
+                message_id=season.progress_message_id,
+            )
+        except TelegramBadRequest:
+            pass # Mensaje sin cambios o borrado por el admin
+        except Exception as e:
+            logger.warning(f"Could not report progress of season rollover {season.id}: {e}")
+
+
+def get_season_progress_text(season: Season, error: str = None) -> str:
+    if error:
+        return f"❌ Error al resetear la temporada: {error}\nSe reanudará automáticamente desde el usuario {season.last_user_id}."
+    if season.status == "done":
+        return (
+            f"✅ ¡Temporada reseteada exitosamente! {season.processed} usuarios archivados.\n"
+            "Todos los puntos, niveles, logros y misiones completadas han sido reiniciados."
+        )
+    return f"⏳ Reseteando temporada... {season.processed}/{season.total} usuarios archivados y reiniciados."
+
+
+# Instancia única: solo puede haber un cierre de temporada en curso
+season_rollover = SeasonRollover()
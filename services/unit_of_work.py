@@ -0,0 +1,34 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from services.point_service import PointService
+from services.level_service import LevelService
+from services.achievement_service import AchievementService
+from services.mission_service import MissionService
+from services.reward_service import RewardService
+import logging
+
+logger = logging.getLogger(__name__)
+
+class UnitOfWork:
+    """One user action in one transaction: the services below run with autocommit=False and the block commits once on exit (rolls back on error)."""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+        self.points = PointService(session, autocommit=False)
+        self.levels = LevelService(session, autocommit=False)
+        self.achievements = AchievementService(session, autocommit=False)
+        self.missions = MissionService(session, autocommit=False)
+        self.rewards = RewardService(session, autocommit=False)
+
+    async def __aenter__(self) -> "UnitOfWork":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.commit()
+        else:
+            logger.warning(f"Rolling back unit of work after error: {exc}")
+            await self.session.rollback()
+
+    async def commit(self):
+        """Flushes and commits all pending changes in one round of writes."""
+        await self.session.commit()
@@ -0,0 +1,36 @@
+# utils/background.py
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Referencias a las tareas en curso: el recolector no las cancela y el apagado puede esperarlas
+_tasks: set[asyncio.Task] = set()
+
+
+def run_in_background(coro, name: str) -> asyncio.Task:
+    """
+    Runs a long handler step (exports, bulk updates) outside the update worker, so the other
+    users routed to the same shard are not kept waiting. Errors are logged.
+    """
+    task = asyncio.create_task(coro, name=name)
+    _tasks.add(task)
+    task.add_done_callback(_finished)
+    return task
+
+
+def _finished(task: asyncio.Task):
+    _tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Background task {task.get_name()} failed: {task.exception()}")
+
+
+async def wait_background_tasks(timeout: float = 30):
+    """Waits up to timeout seconds for the running background tasks at shutdown, then cancels the rest."""
+    if not _tasks:
+        return
+    done, pending = await asyncio.wait(set(_tasks), timeout=timeout)
+    for task in pending:
+        logger.warning(f"Cancelling background task {task.get_name()} at shutdown.")
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
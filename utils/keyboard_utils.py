@@ -1,6 +1,7 @@
 # utils/keyboard_utils.py
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
 from database.models import User
+from utils.messages import BOT_MESSAGES
 
 
 def get_main_menu_keyboard():
@@ -56,19 +57,31 @@ def get_confirm_purchase_keyboard(reward_id: int):
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-def get_ranking_keyboard():
-    """Returns the keyboard for the ranking section."""
-    keyboard = [
-        [InlineKeyboardButton(text="🏠 Menú Principal", callback_data="menu_principal")]
-    ]
+def get_ranking_keyboard(next_cursor: tuple[int, int, int] | None = None, show_first_page: bool = False):
+    """
+    Returns the keyboard for the ranking section.
+    next_cursor is (points, user_id, next_rank): the last row shown and the rank of the row after it.
+    The next page continues after that row (keyset pagination).
+    """
+    keyboard = []
+    nav_buttons = []
+    if show_first_page:
+        nav_buttons.append(InlineKeyboardButton(text=BOT_MESSAGES["ranking_first_page_button_text"], callback_data="menu:ranking"))
+    if next_cursor is not None:
+        points, user_id, next_rank = next_cursor
+        nav_buttons.append(InlineKeyboardButton(text=BOT_MESSAGES["next_page_button_text"], callback_data=f"ranking_page:{points}:{user_id}:{next_rank}"))
+    if nav_buttons:
+        keyboard.append(nav_buttons)
+    keyboard.append([InlineKeyboardButton(text=BOT_MESSAGES["ranking_my_position_button_text"], callback_data="ranking_me")])
+    keyboard.append([InlineKeyboardButton(text="🏠 Menú Principal", callback_data="menu_principal")])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-def get_reaction_keyboard(message_id: int):
-    """Returns an inline keyboard with like/dislike buttons for channel posts."""
+def get_reaction_keyboard(message_id: int, likes: int = 0, dislikes: int = 0):
+    """Returns an inline keyboard with like/dislike buttons for channel posts, with their counts once there are any."""
     keyboard = [
         [
-            InlineKeyboardButton(text="👍 Me gusta", callback_data=f"reaction_like_{message_id}"),
-            InlineKeyboardButton(text="👎 No me gusta", callback_data=f"reaction_dislike_{message_id}")
+            InlineKeyboardButton(text=f"👍 Me gusta ({likes})" if likes else "👍 Me gusta", callback_data=f"reaction_like_{message_id}"),
+            InlineKeyboardButton(text=f"👎 No me gusta ({dislikes})" if dislikes else "👎 No me gusta", callback_data=f"reaction_dislike_{message_id}")
         ]
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
@@ -79,6 +92,7 @@ def get_admin_main_keyboard():
         [InlineKeyboardButton(text="🧑‍💼 Gestionar Usuarios", callback_data="admin_manage_users")],
         [InlineKeyboardButton(text="🎮 Gestionar Contenido/Juego", callback_data="admin_manage_content")],
         [InlineKeyboardButton(text="🎉 Gestionar Eventos y Sorteos", callback_data="admin_manage_events_sorteos")],
+        [InlineKeyboardButton(text="📊 Estadísticas del Canal", callback_data="admin_channel_post_stats")],
         [InlineKeyboardButton(text="⚙️ Configuración del Bot", callback_data="admin_bot_config")],
         [InlineKeyboardButton(text="🔙 Menú Principal", callback_data="menu_principal")]
     ])
@@ -96,6 +110,22 @@ def get_admin_manage_users_keyboard():
     ])
     return keyboard
 
+def get_broadcast_progress_keyboard(broadcast_id: int):
+    """Returns the keyboard attached to a running broadcast's progress message."""
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🛑 Cancelar envío", callback_data=f"admin_broadcast_cancel:{broadcast_id}")]
+    ])
+    return keyboard
+
+def get_export_format_keyboard(formats: list[str]):
+    """Returns one button per available user export format."""
+    labels = {"csv": "📄 CSV (gzip)", "jsonl": "🧾 JSONL (gzip)", "parquet": "📊 Parquet"}
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        *[[InlineKeyboardButton(text=labels.get(fmt, fmt), callback_data=f"admin_export_data:{fmt}")] for fmt in formats],
+        [InlineKeyboardButton(text="🔙 Volver", callback_data="admin_main_menu")]
+    ])
+    return keyboard
+
 def get_admin_manage_content_keyboard():
     """Returns the keyboard for content management options."""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -136,6 +166,14 @@ def get_admin_content_levels_keyboard():
     ])
     return keyboard
 
+def get_admin_adjust_levels_keyboard(pending: int):
+    """Keyboard of the level reconciliation preview; the confirm button only appears if there is something to fix."""
+    rows = []
+    if pending:
+        rows.append([InlineKeyboardButton(text=f"✅ Ajustar {pending} usuarios", callback_data="admin_adjust_levels_confirm")])
+    rows.append([InlineKeyboardButton(text="🔙 Volver", callback_data="admin_content_levels")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
 def get_admin_content_rewards_keyboard():
     """Keyboard for reward catalogue management options."""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
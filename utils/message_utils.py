@@ -1,69 +1,74 @@
 # utils/message_utils.py
 from database.models import User, Mission, Reward
 from services.level_service import get_level_threshold
-from services.achievement_service import ACHIEVEMENTS
+from services.achievement_service import AchievementService
+from services.mission_service import MissionService
+from services.profile_cache import profile_cache
 from utils.messages import BOT_MESSAGES
-import datetime
 
-async def get_profile_message(user: User, active_missions: list[Mission]) -> str:
-    points_to_next_level_text = ""
+def render_achievement_list(achievements: dict) -> str:
+    """Achievements section of the profile, built with a single join."""
+    if not achievements:
+        return BOT_MESSAGES["profile_no_achievements"]
+    achievements_list = [
+        f"{ach.get('icon', '')} {ach.get('name', ach_id)} (Desbloqueado el: {ach['granted_at'].strftime('%d/%m/%Y')})"
+        for ach_id, ach in achievements.items()
+    ]
+    return BOT_MESSAGES["profile_achievements_title"] + "\n" + "\n".join(achievements_list)
+
+def render_mission_list(missions: list[Mission]) -> str:
+    """Active missions section of the profile, built with a single join."""
+    if not missions:
+        return BOT_MESSAGES["profile_no_active_missions"]
+    missions_list = [f"• {mission.name} ({mission.points_reward} Puntos)" for mission in missions]
+    return BOT_MESSAGES["profile_active_missions_title"] + "\n" + "\n".join(missions_list)
+
+async def get_profile_message(user: User, active_missions: list[Mission], achievements: dict) -> str:
+    """
+    `achievements` is the result of AchievementService.get_user_achievements:
+    {achievement_id: {name, icon, granted_at}} already ordered by grant date.
+    """
     next_level_threshold = get_level_threshold(user.level + 1)
     if next_level_threshold != float('inf'):
-        points_needed = next_level_threshold - user.points
-        # Usar el mensaje personalizado para puntos al siguiente nivel
         points_to_next_level_text = BOT_MESSAGES["profile_points_to_next_level"].format(
-            points_needed=points_needed,
+            points_needed=next_level_threshold - user.points,
             next_level=user.level + 1,
-            next_level_threshold=next_level_threshold
+            next_level_threshold=next_level_threshold,
         )
     else:
-        # Usar el mensaje personalizado para nivel máximo
         points_to_next_level_text = BOT_MESSAGES["profile_max_level"]
 
+    return "\n".join((
+        BOT_MESSAGES['profile_title'],
+        "",
+        BOT_MESSAGES["profile_points"].format(user_points=user.points),
+        BOT_MESSAGES["profile_level"].format(user_level=user.level),
+        points_to_next_level_text,
+        "",
+        render_achievement_list(achievements),
+        "",
+        render_mission_list(active_missions),
+    ))
 
-    # Usar el mensaje personalizado para no logros
-    achievements_text = BOT_MESSAGES["profile_no_achievements"]
-    if user.achievements:
-        granted_achievements_list = []
-        for ach_id, timestamp_str in user.achievements.items():
-            if ach_id in ACHIEVEMENTS:
-                granted_achievements_list.append({
-                    "id": ach_id,
-                    "name": ACHIEVEMENTS[ach_id].get("name", ach_id),
-                    "icon": ACHIEVEMENTS[ach_id].get("icon", ""),
-                    "granted_at": timestamp_str
-                })
-        # Ordenar logros por fecha de concesión si es necesario
-        granted_achievements_list.sort(key=lambda x: x['granted_at'])
-        
-        achievements_list = [
-            f"{ach['icon']} {ach['name']} (Desbloqueado el: {datetime.datetime.fromisoformat(ach['granted_at']).strftime('%d/%m/%Y')})"
-            for ach in granted_achievements_list
-        ]
-        achievements_text = BOT_MESSAGES["profile_achievements_title"] + "\n" + "\n".join(achievements_list)
-
-
-    # Usar el mensaje personalizado para no misiones activas
-    missions_text = BOT_MESSAGES["profile_no_active_missions"]
-    if active_missions:
-        missions_list = [
-            f"• {mission.name} ({mission.points_reward} Puntos)"
-            for mission in active_missions
-        ]
-        missions_text = BOT_MESSAGES["profile_active_missions_title"] + "\n" + "\n".join(missions_list)
-
-    return (
-        # Usar mensajes personalizados para cada parte del perfil
-        f"{BOT_MESSAGES['profile_title']}\n\n"
-        f"{BOT_MESSAGES['profile_points'].format(user_points=user.points)}\n"
-        f"{BOT_MESSAGES['profile_level'].format(user_level=user.level)}\n"
-        f"{points_to_next_level_text}\n\n"
-        f"{achievements_text}\n\n" # Incluye el título de logros
-        f"{missions_text}" # Incluye el título de misiones
-    )
+async def get_cached_profile_message(session, user_id: int, user: User = None) -> str | None:
+    """
+    Profile text of the user, served from profile_cache without any query while it is still
+    valid; otherwise rendered with get_profile_message and cached. None if the user is not registered.
+    """
+    text = profile_cache.get(user_id)
+    if text is not None:
+        return text
+    key = profile_cache.key(user_id) # Se lee antes de consultar: un cambio durante el render invalida el resultado
+    user = user or await session.get(User, user_id)
+    if user is None:
+        return None
+    active_missions = await MissionService(session).get_active_missions(user_id=user_id)
+    achievements = await AchievementService(session).get_user_achievements(user_id)
+    text = await get_profile_message(user, active_missions, achievements)
+    profile_cache.put(user_id, key, text)
+    return text
 
 async def get_mission_details_message(mission: Mission) -> str:
-    # Usar el mensaje personalizado para detalles de misión
     return BOT_MESSAGES["mission_details_text"].format(
         mission_name=mission.name,
         mission_description=mission.description,
@@ -72,13 +77,11 @@ async def get_mission_details_message(mission: Mission) -> str:
     )
 
 async def get_reward_details_message(reward: Reward, user_points: int) -> str:
-    stock_info = ""
     if reward.stock != -1:
         stock_info = BOT_MESSAGES["reward_details_stock_info"].format(stock_left=reward.stock)
     else:
         stock_info = BOT_MESSAGES["reward_details_no_stock_info"]
 
-    # Usar el mensaje personalizado para detalles de recompensa
     return BOT_MESSAGES["reward_details_text"].format(
         reward_name=reward.name,
         reward_description=reward.description,
@@ -86,25 +89,26 @@ async def get_reward_details_message(reward: Reward, user_points: int) -> str:
         stock_info=stock_info
     )
 
-async def get_ranking_message(users_ranking: list[User]) -> str:
+async def get_ranking_message(users_ranking: list[User], start_rank: int = 1, title: str = None) -> str:
     """
     Generates a formatted message for the user ranking.
+    start_rank is the position of the first user (pages after the first one start further down).
     """
-    ranking_text = BOT_MESSAGES["ranking_title"] + "\n\n"
+    title = title or BOT_MESSAGES["ranking_title"]
 
     if not users_ranking:
-        return ranking_text + BOT_MESSAGES["no_ranking_data"]
+        return f"{title}\n\n{BOT_MESSAGES['no_ranking_data']}"
 
-    for i, user in enumerate(users_ranking):
-        # Format each user entry
-        # Usa user.username si está disponible, de lo contrario, user.first_name
-        display_name = user.username if user.username else user.first_name if user.first_name else "Usuario Desconocido"
-        ranking_text += BOT_MESSAGES["ranking_entry"].format(
-            rank=i + 1,
-            username=display_name,
+    # Una línea por usuario y un único join (sin concatenar en bucle)
+    format_entry = BOT_MESSAGES["ranking_entry"].format
+    lines = [
+        format_entry(
+            rank=rank,
+            # Usa user.username si está disponible, de lo contrario, user.first_name
+            username=user.username or user.first_name or "Usuario Desconocido",
             points=user.points,
-            level=user.level
-        ) + "\n"
-
-    return ranking_text
-
+            level=user.level,
+        )
+        for rank, user in enumerate(users_ranking, start=start_rank)
+    ]
+    return f"{title}\n\n" + "\n".join(lines) + "\n"
@@ -41,6 +41,9 @@ BOT_MESSAGES = {
     "ranking_title": "🏆 *Tabla de Posiciones*",
     "ranking_entry": "#{rank}. @{username} - Puntos: `{points}`, Nivel: `{level}`",
     "no_ranking_data": "Aún no hay datos en el ranking. ¡Sé el primero en aparecer!",
+    "ranking_my_position_title": "📍 *Tu posición:* `#{rank}`",
+    "ranking_not_ranked": "Todavía no apareces en el ranking. Usa /start y empieza a sumar puntos.",
+    "ranking_end_reached": "No hay más posiciones en el ranking.",
     "back_to_main_menu": "Has regresado al centro del Diván. Elige por dónde seguir explorando.",
 
     # Botones
@@ -55,6 +58,8 @@ BOT_MESSAGES = {
     "back_to_rewards_button_text": "← Volver a recompensas",
     "prev_page_button_text": "← Anterior",
     "next_page_button_text": "Siguiente →",
+    "ranking_my_position_button_text": "📍 Mi posición",
+    "ranking_first_page_button_text": "⏮ Inicio del ranking",
     "back_to_main_menu_button_text": "← Volver al inicio",
 
     # Detalles
@@ -0,0 +1,130 @@
+# webhook.py
+import asyncio
+import logging
+import signal
+from contextlib import suppress
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def shard_key(update: Update) -> int:
+    """
+    Id used to route the update to a worker: the user who triggered it (or the chat for
+    channel posts), so one user's updates are always handled in order by the same worker.
+    """
+    event = update.event
+    user = getattr(event, "from_user", None) or getattr(event, "user", None)
+    if user is not None:
+        return user.id
+    chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+    return update.update_id
+
+
+class ShardedUpdateProcessor:
+    """
+    Fixed pool of workers, each with its own bounded queue. Updates are routed by
+    shard_key(update) % workers: updates of one user are processed sequentially and in
+    arrival order, while different users (e.g. a burst of reactions to a channel post)
+    are processed in parallel. A handler blocks its whole shard while it runs, so long work
+    (exports, bulk updates) is handed to utils.background.run_in_background.
+
+    When a worker's queue is full, submit() waits up to Config.WEBHOOK_BACKPRESSURE_TIMEOUT
+    and then gives up, so the webhook answers 503 and Telegram re-delivers the update later.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, workers: int = None, queue_size: int = None):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.queues = [asyncio.Queue(maxsize=queue_size or Config.UPDATE_QUEUE_SIZE) for _ in range(workers or Config.UPDATE_WORKERS)]
+        self._workers: list[asyncio.Task] = []
+
+    def start(self):
+        self._workers = [asyncio.create_task(self._work(queue)) for queue in self.queues]
+
+    async def submit(self, update: Update) -> bool:
+        queue = self.queues[shard_key(update) % len(self.queues)]
+        try:
+            await asyncio.wait_for(queue.put(update), timeout=Config.WEBHOOK_BACKPRESSURE_TIMEOUT)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _work(self, queue: asyncio.Queue):
+        while True:
+            update = await queue.get()
+            try:
+                await self.dispatcher.feed_update(self.bot, update)
+            except Exception as e:
+                logger.exception(f"Error processing update {update.update_id}: {e}")
+            finally:
+                queue.task_done()
+
+    async def stop(self, timeout: float = 10):
+        """Lets the workers finish the queued updates (up to timeout seconds), then stops them."""
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self.queues)), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Stopping with {sum(queue.qsize() for queue in self.queues)} updates still queued.")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot):
+    """
+    Registers the webhook with Telegram and serves updates until SIGTERM or SIGINT, then drains
+    the queues and runs the shutdown handlers (pipeline and menu-state flushes, FSM close).
+    """
+    if not Config.WEBHOOK_BASE_URL:
+        raise ValueError("BOT_MODE=webhook needs WEBHOOK_BASE_URL (the public URL Telegram will post updates to).")
+    processor = ShardedUpdateProcessor(dispatcher, bot)
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if Config.WEBHOOK_SECRET and request.headers.get(SECRET_HEADER) != Config.WEBHOOK_SECRET:
+            return web.Response(status=401)
+        update = Update.model_validate(await request.json(), context={"bot": bot})
+        if not await processor.submit(update):
+            # Cola llena: Telegram reintentará la entrega más tarde
+            return web.Response(status=503)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(Config.WEBHOOK_PATH, handle_update)
+    runner = web.AppRunner(app)
+
+    await dispatcher.emit_startup(bot=bot, **dispatcher.workflow_data)
+    processor.start()
+    await runner.setup()
+    await web.TCPSite(runner, Config.WEBAPP_HOST, Config.PORT).start()
+    await bot.set_webhook(
+        f"{Config.WEBHOOK_BASE_URL.rstrip('/')}{Config.WEBHOOK_PATH}",
+        secret_token=Config.WEBHOOK_SECRET or None,
+        allowed_updates=dispatcher.resolve_used_update_types(),
+        max_connections=Config.WEBHOOK_MAX_CONNECTIONS,
+    )
+    logger.info(f"Webhook listening on {Config.WEBAPP_HOST}:{Config.PORT}{Config.WEBHOOK_PATH} with {len(processor.queues)} workers.")
+    # Heroku/Railway detienen el dyno con SIGTERM: sin manejador el proceso muere sin pasar por finally
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        with suppress(NotImplementedError): # Windows no admite manejadores de señales en el bucle
+            loop.add_signal_handler(sig, stop_event.set)
+    try:
+        await stop_event.wait()
+        logger.info("Stop signal received, shutting down the webhook.")
+    finally:
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            with suppress(NotImplementedError):
+                loop.remove_signal_handler(sig)
+        await runner.cleanup() # Deja de aceptar updates antes de vaciar las colas
+        await processor.stop()
+        await dispatcher.emit_shutdown(bot=bot, **dispatcher.workflow_data)
+        await bot.session.close()